@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Compare keeping TA's raw JSON with linear playlist scans against the indexed catalog,
+# on a synthetic library. Run from the repository root: python scripts/bench-catalog.py [VIDEOS]
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ta_helper.catalog import Catalog
+
+VIDEOS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+VIDEOS_PER_CHANNEL = 100
+PLAYLISTS_PER_CHANNEL = 3
+ENTRIES_PER_PLAYLIST = 20
+
+def synthetic_library():
+    # JSON texts shaped like TA's API responses, including the fields ta-helper never reads.
+    channels, playlists, videos = [], [], []
+    for c in range(VIDEOS // VIDEOS_PER_CHANNEL):
+        channel_id = "UC%022d" % c
+        channels.append(json.dumps({'channel_id': channel_id, 'channel_name': "Channel %d" % c,
+            'channel_description': "About channel %d. " % c * 20, 'channel_last_refresh': "2024-01-01T00:00:00",
+            'channel_thumb_url': "/cache/channels/%s_thumb.jpg" % channel_id, 'channel_banner_url': "/cache/channels/%s_banner.jpg" % channel_id,
+            'channel_subs': c, 'channel_tags': ["music", "live"], 'channel_views': c * 1000}))
+        chan_video_ids = []
+        for v in range(VIDEOS_PER_CHANNEL):
+            youtube_id = "%05d%06d" % (c, v)
+            chan_video_ids.append(youtube_id)
+            videos.append(json.dumps({'youtube_id': youtube_id, 'title': "Video %d of channel %d" % (v, c),
+                'published': "2023-05-01T00:00:00", 'media_url': "/youtube/%s/%s.mp4" % (channel_id, youtube_id),
+                'vid_thumb_url': "/cache/videos/%s/%s.jpg" % (youtube_id[0], youtube_id),
+                'description': "Description of video %d. " % v * 30, 'playlist': [],
+                'channel': json.loads(channels[-1]),
+                'stats': {'view_count': v, 'like_count': v, 'dislike_count': 0, 'average_rating': 4.5},
+                'tags': ["tag%d" % t for t in range(10)], 'streams': [{'type': "video", 'codec': "vp9", 'width': 1920, 'height': 1080}],
+                'player': {'watched': False, 'duration': 240, 'duration_str': "4m"}, 'vid_type': "videos"}))
+        for p in range(PLAYLISTS_PER_CHANNEL):
+            playlists.append(json.dumps({'playlist_id': "PL%05d%02d" % (c, p), 'playlist_name': "Playlist %d" % p,
+                'playlist_description': "Playlist %d of channel %d." % (p, c), 'playlist_last_refresh': "2024-02-01",
+                'playlist_channel_id': channel_id, 'playlist_thumbnail': "/cache/playlists/PL%05d%02d.jpg" % (c, p),
+                'playlist_entries': [{'youtube_id': youtube_id, 'title': "Entry", 'uploader': "Channel %d" % c, 'idx': i, 'downloaded': True}
+                    for i, youtube_id in enumerate(chan_video_ids[p * ENTRIES_PER_PLAYLIST:(p + 1) * ENTRIES_PER_PLAYLIST])]}))
+    return channels, playlists, videos
+
+def raw_dicts(channels, playlists, videos):
+    channels_data = [json.loads(text) for text in channels]
+    playlists_data = [json.loads(text) for text in playlists]
+    videos_data = [json.loads(text) for text in videos]
+    start = time.perf_counter()
+    for channel in channels_data:
+        chan_playlists = [playlist for playlist in playlists_data if playlist['playlist_channel_id'] == channel['channel_id']]
+    return (channels_data, playlists_data, videos_data), time.perf_counter() - start
+
+def indexed_catalog(channels, playlists, videos):
+    catalog = Catalog()
+    for text in playlists:
+        catalog.add_playlist(json.loads(text))
+    for text in channels:
+        catalog.add_channel(json.loads(text))
+    for text in videos:
+        catalog.add_video(json.loads(text))
+    start = time.perf_counter()
+    for channel_id in catalog.channels:
+        chan_playlists = catalog.channel_playlists(channel_id)
+    return catalog, time.perf_counter() - start
+
+def measure(build, library):
+    # Time without tracing first, tracemalloc slows allocations down considerably.
+    start = time.perf_counter()
+    kept, lookup_seconds = build(*library)
+    seconds = time.perf_counter() - start
+    del kept
+
+    tracemalloc.start()
+    kept, _ = build(*library)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return seconds, lookup_seconds, retained
+
+library = synthetic_library()
+print("Synthetic library: %d channels, %d playlists, %d videos." % tuple(len(texts) for texts in library))
+print("%-16s %12s %18s %14s" % ("", "load seconds", "playlist lookups", "retained MiB"))
+for name, build in [("raw dicts", raw_dicts), ("indexed catalog", indexed_catalog)]:
+    seconds, lookup_seconds, retained = measure(build, library)
+    print("%-16s %12.2f %17.3fs %14.1f" % (name, seconds, lookup_seconds, retained / 2**20))
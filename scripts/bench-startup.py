@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Start-up benchmark of ta-helper, for cron driven QUICK runs that find nothing new.
+# Times a bare interpreter, importing ta_helper.sync, --help and an idle QUICK run against
+# scripts/mock-ta-server.py, and lists the slowest imports.
+#
+#   python scripts/bench-startup.py --repeat 20
+
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(SCRIPTS, "..")
+TA_HELPER = os.path.join(ROOT, "ta-helper.py")
+MOCK_SERVER = os.path.join(SCRIPTS, "mock-ta-server.py")
+
+parser = argparse.ArgumentParser(description="Benchmark ta-helper start-up time.")
+parser.add_argument('--repeat', type=int, default=10, help="runs per case (default 10)")
+parser.add_argument('--videos', type=int, default=100, help="library size of the mock TA server")
+parser.add_argument('--top', type=int, default=10, help="slowest imports to list")
+args = parser.parse_args()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def timed(command, env=None):
+    start = time.monotonic()
+    subprocess.run(command, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.monotonic() - start
+
+def report(name, command, env=None):
+    times = [timed(command, env) for i in range(args.repeat)]
+    print("%-22s %10.1f %10.1f" % (name, min(times) * 1000, statistics.median(times) * 1000), flush=True)
+
+def slowest_imports(env):
+    # Cumulative microseconds of the slowest imports, from python -X importtime.
+    output = subprocess.run([sys.executable, "-X", "importtime", TA_HELPER], env=env, cwd=ROOT,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+    imports = []
+    for line in output.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$", line)
+        # Modules imported by ta-helper's own modules, each level of nesting is indented by two more spaces.
+        if match and len(match.group(2)) <= 4 and not match.group(3).startswith("ta_helper"):
+            imports.append((int(match.group(1)), match.group(3)))
+    return sorted(imports, reverse=True)[:args.top]
+
+root = tempfile.mkdtemp(prefix="ta-helper-startup-")
+port = free_port()
+media = os.path.join(root, "media")
+server = subprocess.Popen([sys.executable, MOCK_SERVER, "--port", str(port), "--videos", str(args.videos), "--media", media],
+    stdout=subprocess.PIPE, text=True)
+try:
+    server.stdout.readline()
+    env = dict(os.environ)
+    env.update({
+        'TA_SERVER': "http://127.0.0.1:%d" % port,
+        'TA_TOKEN': "benchmark",
+        'TA_MEDIA_FOLDER': media,
+        'TA_CACHE': os.path.join(root, "cache"),
+        'TA_CACHE_DOCKER': "True",
+        'TARGET_FOLDER': os.path.join(root, "target"),
+        'GENERATE_NFO': "True",
+        'GENERATE_SHOWS_NFO': "True",
+        'SYMLINK_SUBS': "True",
+        'NOTIFICATIONS_ENABLED': "True",
+        'APPRISE_LINK': "json://127.0.0.1:%d/notify" % port,
+        'NOTIFY_DIGEST': "run",
+        'POSTPROCESS_COMMAND': "",
+        'QUICK': "True",
+        'LOGLEVEL': "WARNING"
+    })
+    # A first run fills the target folder, later ones find nothing new.
+    timed([sys.executable, TA_HELPER], dict(env, NOTIFICATIONS_ENABLED="False"))
+
+    print("%-22s %10s %10s" % ("case", "min ms", "median ms"))
+    report("interpreter", [sys.executable, "-c", "pass"])
+    report("import ta_helper.sync", [sys.executable, "-c", "import ta_helper.sync"], env)
+    report("--help", [sys.executable, TA_HELPER, "--help"], env)
+    report("idle QUICK run", [sys.executable, TA_HELPER], env)
+
+    print("\nSlowest imports of an idle QUICK run:")
+    for microseconds, name in slowest_imports(env):
+        print("%10.1f ms  %s" % (microseconds / 1000, name))
+finally:
+    server.terminate()
+    server.wait()
+    subprocess.run(["rm", "-rf", root])
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# End-to-end benchmark of ta-helper.py against scripts/mock-ta-server.py.
+# For each library size, runs ta-helper on a fresh temporary TARGET_FOLDER and reports wall time,
+# API calls, filesystem operations and peak RSS of a cold run, an unchanged QUICK run, a full
+# re-run without QUICK and a clean-up run after every tenth video was deleted from TA.
+#
+#   python scripts/benchmark.py --videos 1000 --videos 100000 --latency 5
+
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+TA_HELPER = os.path.join(SCRIPTS, "..", "ta-helper.py")
+MOCK_SERVER = os.path.join(SCRIPTS, "mock-ta-server.py")
+
+parser = argparse.ArgumentParser(description="Benchmark ta-helper.py against a mock TA server.")
+parser.add_argument('--videos', type=int, action='append', help="library size, may be repeated (default 1000)")
+parser.add_argument('--videos-per-channel', type=int, default=100)
+parser.add_argument('--latency', type=float, default=0, help="milliseconds added to every API call")
+parser.add_argument('--keep', action='store_true', help="keep the temporary folders")
+parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE', help="extra setting for ta-helper, may be repeated")
+args = parser.parse_args()
+
+filesystem_pattern = re.compile(r"(?:Filesystem|Dry run, would apply): (.*)\.$", re.MULTILINE)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def api_calls(port):
+    with urllib.request.urlopen("http://127.0.0.1:%d/_stats" % port) as response:
+        return json.load(response)['calls']
+
+def run_helper(env, log_path):
+    # Returns wall seconds, peak RSS in MiB and the exit code of one ta-helper run.
+    with open(log_path, "w") as log:
+        start = time.monotonic()
+        proc = subprocess.Popen([sys.executable, TA_HELPER], env=env, stdout=log, stderr=subprocess.STDOUT)
+        pid, status, usage = os.wait4(proc.pid, 0)
+        seconds = time.monotonic() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return seconds, usage.ru_maxrss / 1024, proc.returncode
+
+def filesystem_ops(log_path):
+    with open(log_path) as log:
+        found = filesystem_pattern.findall(log.read())
+    if not found:
+        return {}
+    return {op: int(count) for count, op in (item.split(" ", 1) for item in found[-1].split(", "))}
+
+def benchmark(videos, root):
+    port = free_port()
+    media = os.path.join(root, "media")
+    server = subprocess.Popen([sys.executable, MOCK_SERVER, "--port", str(port), "--videos", str(videos),
+        "--videos-per-channel", str(args.videos_per_channel), "--latency", str(args.latency), "--media", media],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        # The server prints a line once the library is ready.
+        server.stdout.readline()
+
+        env = dict(os.environ)
+        env.update({
+            'TA_SERVER': "http://127.0.0.1:%d" % port,
+            'TA_TOKEN': "benchmark",
+            'TA_MEDIA_FOLDER': media,
+            'TA_CACHE': os.path.join(root, "cache"),
+            'TA_CACHE_DOCKER': "True",
+            'TARGET_FOLDER': os.path.join(root, "target"),
+            'GENERATE_NFO': "True",
+            'GENERATE_SHOWS_NFO': "True",
+            'SYMLINK_SUBS': "True",
+            'NOTIFICATIONS_ENABLED': "False",
+            'POSTPROCESS_COMMAND': "",
+            'QUICK': "True",
+            'CLEANUP_DELETED_VIDEOS': "False"
+        })
+        env.update(setting.split("=", 1) for setting in args.env)
+
+        runs = [
+            ("cold", {}),
+            ("quick", {}),
+            ("full", {'QUICK': "False"}),
+            ("cleanup", {'CLEANUP_DELETED_VIDEOS': "True"})
+        ]
+        results = []
+        for name, overrides in runs:
+            if name == "cleanup":
+                urllib.request.urlopen(urllib.request.Request("http://127.0.0.1:%d/_drop?every=10" % port, method="POST")).close()
+            calls = api_calls(port)
+            log_path = os.path.join(root, name + ".log")
+            seconds, rss, exit_code = run_helper(dict(env, **overrides), log_path)
+            if exit_code != 0:
+                print("ta-helper exited with %d, see %s" % (exit_code, log_path))
+            ops = filesystem_ops(log_path)
+            results.append((name, seconds, api_calls(port) - calls, sum(count for op, count in ops.items() if op != 'unchanged'), rss))
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+print("%10s %-8s %10s %10s %12s %10s" % ("videos", "run", "seconds", "API calls", "fs changes", "peak MiB"))
+for videos in args.videos or [1000]:
+    root = tempfile.mkdtemp(prefix="ta-helper-bench-")
+    for name, seconds, calls, changes, rss in benchmark(videos, root):
+        print("%10d %-8s %10.2f %10d %12d %10.1f" % (videos, name, seconds, calls, changes, rss), flush=True)
+    if args.keep:
+        print("Kept %s" % root)
+    else:
+        subprocess.run(["rm", "-rf", root])
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# Stand-in for the parts of TA's API that ta-helper uses, serving a synthetic library.
+# Videos are derived from their position on the fly, so even a 1M video library takes no memory.
+#
+# GET /_stats returns the API calls served so far, POST /_drop?every=N deletes every Nth
+# video of each channel (and its media file, with --media), to exercise clean-up runs.
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+parser = argparse.ArgumentParser(description="Serve a synthetic Tube Archivist library.")
+parser.add_argument('--port', type=int, default=8765)
+parser.add_argument('--videos', type=int, default=1000, help="videos in the whole library")
+parser.add_argument('--videos-per-channel', type=int, default=100)
+parser.add_argument('--playlists-per-channel', type=int, default=2)
+parser.add_argument('--playlist-entries', type=int, default=10)
+parser.add_argument('--page-size', type=int, default=12, help="same as TA's default")
+parser.add_argument('--latency', type=float, default=0, help="milliseconds added to every API call")
+parser.add_argument('--errors', type=float, default=0, help="fraction of API calls answered with 503, to exercise retries")
+parser.add_argument('--media', help="create empty media files for all videos in this folder")
+args = parser.parse_args()
+
+CHANNELS = max(1, args.videos // args.videos_per_channel)
+stats = {'calls': 0, 'by_endpoint': {}}
+stats_lock = threading.Lock()
+drop_every = 0
+
+def channel_id(c):
+    return "UC%022d" % c
+
+def youtube_id(c, v):
+    return "v%05d%05d" % (c, v)
+
+def playlist_id(c, p):
+    return "PL%05d%03d" % (c, p)
+
+def dropped(v):
+    return drop_every and v % drop_every == drop_every - 1
+
+def channel_videos(c):
+    return [v for v in range(args.videos_per_channel) if not dropped(v)]
+
+def channel(c):
+    return {
+        'channel_id': channel_id(c),
+        'channel_name': "Channel %d" % c,
+        'channel_description': "Synthetic channel %d.\nSecond line." % c,
+        'channel_last_refresh': "2024-01-01T00:00:00",
+        'channel_thumb_url': "/cache/channels/%s_thumb.jpg" % channel_id(c),
+        'channel_banner_url': "/cache/channels/%s_banner.jpg" % channel_id(c),
+        'channel_subscribed': True
+    }
+
+def video(c, v):
+    p = v // args.playlist_entries
+    yid = youtube_id(c, v)
+    return {
+        'youtube_id': yid,
+        'title': "Video %d of channel %d" % (v, c),
+        'published': "20%02d-%02d-%02dT00:00:00" % (10 + v // 336 % 90, v // 28 % 12 + 1, v % 28 + 1),
+        'media_url': "/youtube/%s/%s.mp4" % (channel_id(c), yid),
+        'vid_thumb_url': "/cache/videos/%s/%s.jpg" % (yid[1], yid),
+        'description': "Description of video %d & <co>." % v,
+        'playlist': [playlist_id(c, p)] if p < args.playlists_per_channel else [],
+        'channel': {'channel_id': channel_id(c), 'channel_name': "Channel %d" % c},
+        'stats': {'view_count': v, 'like_count': v // 2},
+        'vid_type': "videos"
+    }
+
+def playlist(c, p):
+    first = p * args.playlist_entries
+    return {
+        'playlist_id': playlist_id(c, p),
+        'playlist_name': "Playlist %d" % p,
+        'playlist_description': "Synthetic playlist %d of channel %d." % (p, c),
+        'playlist_last_refresh': "2024-02-01T00:00:00",
+        'playlist_channel_id': channel_id(c),
+        'playlist_thumbnail': "/cache/playlists/%s.jpg" % playlist_id(c, p),
+        'playlist_entries': [{'youtube_id': youtube_id(c, v), 'idx': v - first, 'downloaded': True}
+            for v in range(first, first + args.playlist_entries) if v < args.videos_per_channel and not dropped(v)]
+    }
+
+def paginate(total, page, build):
+    # Same shape as TA, last_page stays truthy until the last page is reached.
+    last = max(1, -(-total // args.page_size))
+    start = (page - 1) * args.page_size
+    return {
+        'data': [build(i) for i in range(start, min(start + args.page_size, total))],
+        'paginate': {
+            'page_size': args.page_size,
+            'page_from': start,
+            'current_page': page,
+            'last_page': last if page < last else False,
+            'total_hits': total
+        }
+    }
+
+def media_path(c, v):
+    return os.path.join(args.media, channel_id(c), youtube_id(c, v) + ".mp4")
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *log_args):
+        pass
+
+    def reply(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', "application/json")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        page = int(query.get('page', ["1"])[0])
+
+        if url.path == "/_stats":
+            with stats_lock:
+                return self.reply(stats)
+
+        endpoint = re.sub(r"/[^/]+/$", "/<id>/", url.path) if url.path.count("/") > 3 else url.path
+        with stats_lock:
+            stats['calls'] += 1
+            stats['by_endpoint'][endpoint] = stats['by_endpoint'].get(endpoint, 0) + 1
+        if args.latency:
+            time.sleep(args.latency / 1000)
+        if random.random() < args.errors:
+            return self.reply({'error': "unavailable"}, 503)
+
+        match = re.fullmatch(r"/api/(channel|playlist|video)/(?:([\w-]+)/)?", url.path)
+        if not match:
+            return self.reply({'error': "not found"}, 404)
+        kind, id = match.groups()
+
+        try:
+            if kind == 'channel' and id is None:
+                return self.reply(paginate(CHANNELS, page, channel))
+            if kind == 'channel':
+                c = int(id[2:]) if id.startswith("UC") else CHANNELS
+                return self.reply(channel(c)) if c < CHANNELS else self.reply({'error': "not found"}, 404)
+            if kind == 'playlist' and id is None:
+                total = CHANNELS * args.playlists_per_channel
+                return self.reply(paginate(total, page, lambda i: playlist(i // args.playlists_per_channel, i % args.playlists_per_channel)))
+            if kind == 'video' and id is None:
+                if 'channel' in query:
+                    c = int(query['channel'][0][2:])
+                    # Newest first, like TA.
+                    videos = channel_videos(c)[::-1] if c < CHANNELS else []
+                    return self.reply(paginate(len(videos), page, lambda i: video(c, videos[i])))
+                total = CHANNELS * args.videos_per_channel
+                return self.reply(paginate(total, page, lambda i: video(i // args.videos_per_channel, i % args.videos_per_channel)))
+            if kind == 'video':
+                c, v = int(id[1:6]), int(id[6:])
+                if c < CHANNELS and v < args.videos_per_channel and not dropped(v):
+                    return self.reply(video(c, v))
+        except ValueError:
+            # Not an id this server hands out.
+            pass
+        return self.reply({'error': "not found"}, 404)
+
+    def do_POST(self):
+        global drop_every
+        url = urlparse(self.path)
+        if url.path != "/_drop":
+            return self.reply({'error': "not found"}, 404)
+        drop_every = int(parse_qs(url.query).get('every', ["10"])[0])
+        if args.media:
+            for c in range(CHANNELS):
+                for v in range(args.videos_per_channel):
+                    if dropped(v) and os.path.exists(media_path(c, v)):
+                        os.remove(media_path(c, v))
+        self.reply({'dropped_every': drop_every})
+
+if args.media:
+    for c in range(CHANNELS):
+        os.makedirs(os.path.join(args.media, channel_id(c)), exist_ok=True)
+        for v in range(args.videos_per_channel):
+            open(media_path(c, v), "w").close()
+
+server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+# benchmark.py waits for this line, so only print it once the port accepts connections.
+print("Serving %d channels, %d videos on port %d." % (CHANNELS, CHANNELS * args.videos_per_channel, args.port), flush=True)
+server.serve_forever()
@@ -17,9 +17,25 @@ DIRS=(
     "xKito Music"
 )
 
-for dirname in "${DIRS[@]}";
+fullpaths=()
+if [ -n "$TA_HELPER_CHANGES_FILE" ]; then
+    # Run by ta-helper, only scan the folders of DIRS it added or moved videos to.
+    while IFS= read -r folder; do
+        for dirname in "${DIRS[@]}"; do
+            if [[ -d "$folder" && ( "$folder" == "$ROOT/$dirname" || "$folder" == "$ROOT/$dirname/"* ) ]]; then
+                fullpaths+=("$folder")
+                break
+            fi
+        done
+    done < <(awk -F '\t' '$1 != "deleted" && $2 ~ /\.mp4$/ { sub(/\/[^\/]*$/, "", $2); print $2 }' "$TA_HELPER_CHANGES_FILE" | sort -u)
+else
+    for dirname in "${DIRS[@]}"; do
+        fullpaths+=("$ROOT/$dirname")
+    done
+fi
+
+for fullpath in "${fullpaths[@]}";
 do
-    fullpath="$ROOT/$dirname"
     echo "$fullpath"
     $RSGAIN_BINARY easy -S -m MAX "$fullpath"
 done
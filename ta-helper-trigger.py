@@ -1,28 +1,127 @@
 from dotenv import load_dotenv
-from flask import Flask, request, Response
+from flask import Flask, request, Response, jsonify
+import importlib
 import os
+import re
 import subprocess
 import sys
+from ta_helper.runs import RunQueue
+from ta_helper.util import strtobool
+import threading
+import time
+import traceback
 
 # Pull configuration details from .env file.
 load_dotenv()
 TA_HELPER_SCRIPT = os.environ.get("TA_HELPER_SCRIPT")
 APPRISE_TRIGGER_PORT = os.environ.get("APPRISE_TRIGGER_PORT")
+TRIGGER_DEBOUNCE = float(os.environ.get("TRIGGER_DEBOUNCE", "10"))
+TRIGGER_DEBOUNCE_MAX = float(os.environ.get("TRIGGER_DEBOUNCE_MAX", "60"))
+TRIGGER_IN_PROCESS = bool(strtobool(os.environ.get("TRIGGER_IN_PROCESS", "False")))
+
+# YouTube video and channel ids, as they show up in TA's notification texts and links, and in the
+# "Title - [id]" names of the symlinks.
+video_id_pattern = re.compile(r"(?:[?&]v=|youtu\.be/|/video/| - \[)([\w-]{11})(?![\w-])")
+channel_id_pattern = re.compile(r"(?<![\w-])(UC[\w-]{22})(?![\w-])")
+
+def payload_strings(payload):
+    # Yield every string value in the notification payload, however it is nested.
+    if isinstance(payload, str):
+        yield payload
+    elif isinstance(payload, dict):
+        for value in payload.values():
+            yield from payload_strings(value)
+    elif isinstance(payload, list):
+        for value in payload:
+            yield from payload_strings(value)
+
+def extract_targets(payload):
+    video_ids = []
+    channel_ids = []
+    for text in payload_strings(payload):
+        video_ids.extend(video_id_pattern.findall(text))
+        channel_ids.extend(channel_id_pattern.findall(text))
+    return list(dict.fromkeys(video_ids)), list(dict.fromkeys(channel_ids))
+
+class ScriptQueue(RunQueue):
+    # Runs ta-helper one invocation at a time. Triggers arriving in a burst, or while
+    # a run is in flight, are merged into a single queued run.
+
+    def __init__(self, debounce, debounce_max):
+        super().__init__()
+        self.debounce = debounce
+        self.debounce_max = debounce_max
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def wait_for_work(self):
+        with self.cond:
+            while self.pending is None:
+                self.cond.wait()
+
+            # Wait for the burst to settle, but never hold work back longer than debounce_max.
+            while True:
+                now = time.monotonic()
+                deadline = min(self.last_trigger + self.debounce, self.first_trigger + self.debounce_max)
+                if now >= deadline:
+                    break
+                self.cond.wait(deadline - now)
+
+            return self.take()
+
+    def worker(self):
+        while True:
+            work = self.wait_for_work()
+
+            args = []
+            if not work['full']:
+                for video_id in work['videos']:
+                    args += ["--video", video_id]
+                for channel_id in work['channels']:
+                    args += ["--channel", channel_id]
+                print("Targeted sync of %d videos and %d channels." % (len(work['videos']), len(work['channels'])))
+
+            start = time.monotonic()
+            try:
+                exit_code = subprocess.run([sys.executable, TA_HELPER_SCRIPT] + args).returncode
+            except Exception:
+                # Keep the worker alive, or every later trigger would be queued forever.
+                print("Unable to run the helper script:")
+                traceback.print_exc()
+                exit_code = 1
+            self.finish(start, exit_code)
+
+def load_helper():
+    # Import the ta_helper package next to TA_HELPER_SCRIPT into this process.
+    sys.path.insert(0, os.path.dirname(os.path.abspath(TA_HELPER_SCRIPT)))
+    return importlib.import_module("ta_helper.sync")
+
+if TRIGGER_IN_PROCESS:
+    # Keep ta-helper warm in this process, it polls TA and syncs triggers without starting a new interpreter.
+    run_queue = load_helper().start_daemon()
+else:
+    run_queue = ScriptQueue(TRIGGER_DEBOUNCE, TRIGGER_DEBOUNCE_MAX)
 
 app = Flask(__name__)
 @app.route('/ta-helper-trigger', methods=['POST'])
 
 def return_response():
-    print(request.json);
+    payload = request.get_json(silent=True)
+    print(payload);
     result = Response(status=200)
 
     # Kickstart ta-helper script as there have been changes.
-    print("TA has made changes to the video archive, invoking helper script.")
+    print("TA has made changes to the video archive, queueing helper script.")
 
-    # Use Popen so we immediately return and sending apprise doesn't time out.
-    subprocess.Popen([sys.executable, TA_HELPER_SCRIPT])
+    # Only sync what the notification is about, or everything if it does not tell.
+    # The run happens in the background, so we immediately return and sending apprise doesn't time out.
+    video_ids, channel_ids = extract_targets(payload)
+    run_queue.add(video_ids, channel_ids)
 
-    ## Do something with the request.json data.
     return result
 
+@app.route('/ta-helper-trigger/status', methods=['GET'])
+
+def return_status():
+    return jsonify(run_queue.status())
+
 if __name__ == "__main__": app.run(host="0.0.0.0", port=APPRISE_TRIGGER_PORT)
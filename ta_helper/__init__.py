@@ -0,0 +1,2 @@
+# Post processes Tube Archivist products into human readable folders, see sync.main().
+# Importing the package stays cheap, the sync module and its dependencies load on first use.
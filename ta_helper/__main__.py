@@ -0,0 +1,3 @@
+from ta_helper.sync import main
+
+main()
@@ -0,0 +1,134 @@
+import random
+import requests
+import threading
+import time
+
+class ApiError(Exception):
+    pass
+
+class ApiClient:
+    # Shared client for TA's API. Every GET has a timeout and is retried with jittered exponential
+    # backoff. The number of requests in flight adapts to TA: it grows while latency stays close to
+    # the best seen, and is cut back when latency climbs or requests fail, e.g. while TA is indexing.
+
+    def __init__(self, token, max_in_flight, timeout=30, retries=4, backoff=1, logger=None, metrics=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.logger = logger
+        self.metrics = metrics
+        self.max_in_flight = max(1, max_in_flight)
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': 'Token ' + token})
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.limit = float(self.max_in_flight)
+        self.latency = None
+        self.best_latency = None
+        self.last_decrease = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.cond:
+            self.requests = 0
+            self.retried = 0
+            self.failed = 0
+            self.total_latency = 0.0
+            self.min_limit = self.limit
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, overloaded=False):
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if latency is not None:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                if self.best_latency is None or self.latency < self.best_latency:
+                    self.best_latency = self.latency
+                else:
+                    # Let the reference follow TA slowly, should it stay slower for good.
+                    self.best_latency += (self.latency - self.best_latency) * 0.01
+                overloaded = overloaded or self.latency > 2 * self.best_latency
+
+            if overloaded:
+                # Back off at most once a second, a burst of slow requests is one event.
+                if now - self.last_decrease >= 1:
+                    self.limit = max(1.0, self.limit * 0.7)
+                    self.min_limit = min(self.min_limit, self.limit)
+                    self.last_decrease = now
+            elif latency is not None:
+                self.limit = min(float(self.max_in_flight), self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def get(self, url, params=None):
+        # Returns TA's JSON response, or None if TA does not know the requested item.
+        # Raises ApiError once all retries are used up.
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = random.uniform(0, self.backoff * 2 ** (attempt - 1))
+                if self.logger:
+                    self.logger.info("Retrying %s in %.1fs (%s).", url, delay, error)
+                self.count('http_retries')
+                with self.cond:
+                    self.retried += 1
+                time.sleep(delay)
+
+            self.acquire()
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                data = response.content
+            except requests.RequestException as exception:
+                self.release(overloaded=True)
+                self.count('http_errors')
+                error = exception
+                continue
+            latency = time.monotonic() - start
+
+            self.count('http_requests')
+            self.count('http_bytes', len(data))
+            with self.cond:
+                self.requests += 1
+                self.total_latency += latency
+
+            if response.status_code == 429 or response.status_code >= 500:
+                self.release(overloaded=True)
+                self.count('http_errors')
+                error = "HTTP %d" % response.status_code
+                continue
+            self.release(latency)
+
+            if response.status_code == 404:
+                return None
+            if response.status_code != 200:
+                self.count('http_errors')
+                raise ApiError("%s: HTTP %d" % (url, response.status_code))
+            try:
+                return response.json()
+            except ValueError as exception:
+                # A truncated or garbled body, worth another try.
+                error = exception
+                continue
+
+        with self.cond:
+            self.failed += 1
+        raise ApiError("%s: %s" % (url, error))
+
+    def count(self, name, n=1):
+        if self.metrics is not None:
+            self.metrics.count(name, n)
+
+    def stats(self):
+        with self.cond:
+            average = self.total_latency / self.requests if self.requests else 0
+            return "%d requests, %d retries, %d failed, %.0fms average latency, in-flight limit %d (lowest %d, at most %d)" % (
+                self.requests, self.retried, self.failed, average * 1000, int(self.limit), int(self.min_limit), self.max_in_flight)
@@ -0,0 +1,164 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+
+# How posters, covers and banners get into TARGET_FOLDER: symlinked into TA's cache,
+# or materialized as real files from the artwork store.
+MODES = ['symlink', 'materialize']
+
+# Linux ioctl making a file share the data blocks of another, on btrfs, XFS and other reflink capable filesystems.
+FICLONE = 0x40049409
+
+def reflink(source, path):
+    with open(source, "rb") as src, open(path, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+class ArtworkStore:
+    # Content-addressed copies of TA's artwork, for media-server clients that cannot follow symlinks into
+    # the TA cache. Each image is stored once under the hash of its content, as a reflink or hardlink of
+    # the cache file when both are on the same filesystem, or as a copy downscaled to max_size pixels otherwise.
+    # The index remembers which stored file each cache file became at its current mtime, so artwork
+    # that did not change is neither read nor hashed again.
+
+    def __init__(self, root, state, max_size, logger, metrics=None):
+        self.root = root
+        self.state = state
+        self.max_size = max_size
+        self.logger = logger
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        # Loaded from the state database on first use, as {source: (mtime, path)}.
+        self.index = None
+        self.warned = False
+
+    def load_index(self):
+        with self.lock:
+            if self.index is None:
+                self.index = self.state.get_artwork()
+            return self.index
+
+    def lookup(self, source):
+        # The stored file of source, or None if source changed since, or was never materialized.
+        try:
+            mtime = os.stat(source).st_mtime_ns
+        except OSError:
+            return None
+        entry = self.load_index().get(source)
+        if entry is not None and entry[0] == mtime and os.path.exists(entry[1]):
+            return entry[1]
+        return None
+
+    def materialize(self, source):
+        # The stored file of source, adding it to the store first if needed. None if source is missing.
+        stored = self.lookup(source)
+        if stored is not None:
+            return stored
+        try:
+            mtime = os.stat(source).st_mtime_ns
+            with open(source, "rb") as f:
+                digest = hashlib.file_digest(f, "sha256").hexdigest()
+        except OSError as error:
+            self.logger.debug("No artwork to materialize at \"%s\": %s", source, error)
+            return None
+
+        extension = os.path.splitext(source)[1].lower() or ".jpg"
+        stored = os.path.join(self.root, digest[:2], digest + extension)
+        if not os.path.exists(stored):
+            os.makedirs(os.path.dirname(stored), exist_ok=True)
+            how = self.store(source, stored)
+            self.logger.debug("Stored artwork \"%s\" as %s \"%s\".", source, how, stored)
+            if self.metrics is not None:
+                self.metrics.count('artwork_stored')
+
+        self.state.put_artwork(source, mtime, stored)
+        with self.lock:
+            self.index[source] = (mtime, stored)
+        return stored
+
+    def store(self, source, stored):
+        # Write through a temporary file, so a stored file is always complete. Returns how it was stored.
+        # Reflinks come first, as TA rewriting a cache file in place would also change a hardlinked copy.
+        temp_path = "%s.%d.%d.tmp" % (stored, os.getpid(), threading.get_ident())
+        try:
+            try:
+                reflink(source, temp_path)
+                how = 'reflink'
+            except OSError:
+                try:
+                    os.remove(temp_path)
+                except FileNotFoundError:
+                    pass
+                try:
+                    os.link(source, temp_path)
+                    how = 'hardlink'
+                except OSError:
+                    how = self.copy(source, temp_path)
+            os.replace(temp_path, stored)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return how
+
+    def copy(self, source, path):
+        if not self.max_size:
+            shutil.copyfile(source, path)
+            return 'copy'
+        try:
+            # Pillow is optional, without it artwork is copied at full size.
+            from PIL import Image
+        except ImportError:
+            if not self.warned:
+                self.logger.warning("Pillow is not installed, copying artwork without downscaling it.")
+                self.warned = True
+            shutil.copyfile(source, path)
+            return 'copy'
+
+        try:
+            with Image.open(source) as image:
+                if max(image.size) <= self.max_size:
+                    shutil.copyfile(source, path)
+                    return 'copy'
+                image_format = image.format
+                image.thumbnail((self.max_size, self.max_size))
+                image.save(path, format=image_format, quality=90)
+        except OSError as error:
+            self.logger.debug("Unable to downscale artwork \"%s\", copying it: %s", source, error)
+            shutil.copyfile(source, path)
+            return 'copy'
+        return 'downscaled copy'
+
+    def prune(self, states=None):
+        # Forget cache files that are gone, and delete stored files no cache file maps to anymore.
+        # states are all the state databases whose index uses the store, this one's by default.
+        # Files in TARGET_FOLDER are links of their own, so they are not affected.
+        # Returns how many stored files were deleted.
+        used = set()
+        for state in states or [self.state]:
+            if state is self.state:
+                index = self.load_index()
+            else:
+                index = state.get_artwork()
+            with self.lock:
+                gone = [source for source in index if not os.path.exists(source)]
+                for source in gone:
+                    del index[source]
+                used.update(path for mtime, path in index.values())
+            if gone:
+                state.delete_artwork(gone)
+
+        deleted = 0
+        if not os.path.isdir(self.root):
+            return deleted
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            for stored in os.scandir(entry):
+                if stored.path not in used:
+                    os.remove(stored.path)
+                    deleted += 1
+        return deleted
@@ -0,0 +1,106 @@
+import sys
+
+# Compact records of the TA library. TA's JSON is trimmed down to the fields ta-helper
+# uses as soon as it arrives, and ids shared by many records are interned.
+
+class Channel:
+    __slots__ = ('channel_id', 'channel_name', 'channel_description', 'channel_last_refresh',
+        'channel_thumb_url', 'channel_banner_url')
+
+    def __init__(self, data):
+        self.channel_id = sys.intern(data['channel_id'])
+        self.channel_name = data.get('channel_name')
+        self.channel_description = data.get('channel_description')
+        self.channel_last_refresh = data.get('channel_last_refresh')
+        self.channel_thumb_url = data.get('channel_thumb_url')
+        self.channel_banner_url = data.get('channel_banner_url')
+
+class Playlist:
+    __slots__ = ('playlist_id', 'playlist_name', 'playlist_description', 'playlist_last_refresh',
+        'playlist_channel_id', 'playlist_thumbnail', 'entries')
+
+    def __init__(self, data):
+        self.playlist_id = sys.intern(data['playlist_id'])
+        self.playlist_name = data.get('playlist_name')
+        self.playlist_description = data.get('playlist_description')
+        self.playlist_last_refresh = data.get('playlist_last_refresh')
+        self.playlist_channel_id = sys.intern(data.get('playlist_channel_id') or "")
+        self.playlist_thumbnail = data.get('playlist_thumbnail')
+        # (youtube_id, downloaded) pairs, in playlist order.
+        self.entries = tuple((entry['youtube_id'], bool(entry.get('downloaded'))) for entry in data.get('playlist_entries') or [])
+
+class Video:
+    __slots__ = ('youtube_id', 'title', 'published', 'media_url', 'vid_thumb_url', 'description',
+        'playlist', 'channel_id', 'channel_name', 'view_count', 'like_count')
+
+    def __init__(self, data):
+        # Takes TA's video JSON, or the trimmed form to_json() returns.
+        channel = data['channel']
+        stats = data.get('stats') or {}
+        self.youtube_id = data['youtube_id']
+        self.title = data.get('title')
+        self.published = data.get('published')
+        self.media_url = data.get('media_url')
+        self.vid_thumb_url = data.get('vid_thumb_url')
+        self.description = data.get('description')
+        self.playlist = tuple(sys.intern(playlist_id) for playlist_id in data.get('playlist') or [])
+        self.channel_id = sys.intern(channel['channel_id'])
+        self.channel_name = channel.get('channel_name')
+        self.view_count = stats.get('view_count', 0)
+        self.like_count = stats.get('like_count', 0)
+
+    def to_json(self):
+        return {
+            'youtube_id': self.youtube_id,
+            'title': self.title,
+            'published': self.published,
+            'media_url': self.media_url,
+            'vid_thumb_url': self.vid_thumb_url,
+            'description': self.description,
+            'playlist': list(self.playlist),
+            'channel': {
+                'channel_id': self.channel_id,
+                'channel_name': self.channel_name
+            },
+            'stats': {
+                'view_count': self.view_count,
+                'like_count': self.like_count
+            }
+        }
+
+class Catalog:
+    # Channels, playlists and videos of one sync, indexed by their ids.
+    # Videos are only kept while their channel is synced, see drop_videos().
+
+    def __init__(self):
+        self.channels = {}
+        self.playlists = {}
+        self.videos = {}
+        self.playlists_by_channel = {}
+        self.videos_by_channel = {}
+
+    def add_channel(self, data):
+        channel = Channel(data)
+        self.channels[channel.channel_id] = channel
+        return channel
+
+    def add_playlist(self, data):
+        playlist = Playlist(data)
+        self.playlists[playlist.playlist_id] = playlist
+        self.playlists_by_channel.setdefault(playlist.playlist_channel_id, []).append(playlist)
+        return playlist
+
+    def add_video(self, video):
+        if not isinstance(video, Video):
+            video = Video(video)
+        self.videos[video.youtube_id] = video
+        self.videos_by_channel.setdefault(video.channel_id, []).append(video.youtube_id)
+        return video
+
+    def channel_playlists(self, channel_id):
+        return self.playlists_by_channel.get(channel_id, [])
+
+    def drop_videos(self, channel_id):
+        # Forget a channel's videos once it is synced, so memory does not grow with the library.
+        for youtube_id in self.videos_by_channel.pop(channel_id, []):
+            self.videos.pop(youtube_id, None)
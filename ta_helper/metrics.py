@@ -0,0 +1,106 @@
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+# Counters always present in reports, even when a run did not touch them.
+COUNTERS = ['http_requests', 'http_bytes', 'http_retries', 'http_errors', 'folders_created', 'symlinks_created',
+    'symlinks_retargeted', 'hardlinks_created', 'hardlinks_replaced', 'files_renamed', 'nfos_written', 'files_removed',
+    'folders_removed', 'notifications_queued', 'notifications_sent', 'notifications_failed', 'replaygain_analysed',
+    'replaygain_failed', 'artwork_stored']
+
+class Metrics:
+    # Per-phase timers and counters of one run. Phases run by several workers at once add up
+    # their time, so they may exceed the run's wall time.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.start = time.monotonic()
+            self.duration = None
+            self.success = None
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.phases = {}
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_phase_time(self, name, seconds):
+        with self.lock:
+            total, calls = self.phases.get(name, (0.0, 0))
+            self.phases[name] = (total + seconds, calls + 1)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, time.monotonic() - start)
+
+    def finish(self, success):
+        with self.lock:
+            self.duration = time.monotonic() - self.start
+            self.success = success
+
+    def report(self):
+        with self.lock:
+            return {
+                'started': self.started,
+                'duration_seconds': self.duration if self.duration is not None else time.monotonic() - self.start,
+                'success': self.success,
+                'phases': {name: {'seconds': round(seconds, 6), 'calls': calls} for name, (seconds, calls) in sorted(self.phases.items())},
+                'counters': dict(self.counters)
+            }
+
+    def summary(self):
+        report = self.report()
+        return ", ".join("%s %.2fs" % (name, phase['seconds']) for name, phase in report['phases'].items())
+
+def prometheus_text(report):
+    lines = [
+        "# HELP ta_helper_last_run_timestamp_seconds When the last ta-helper run started.",
+        "# TYPE ta_helper_last_run_timestamp_seconds gauge",
+        "ta_helper_last_run_timestamp_seconds %f" % report['started'],
+        "# HELP ta_helper_last_run_duration_seconds How long the last ta-helper run took.",
+        "# TYPE ta_helper_last_run_duration_seconds gauge",
+        "ta_helper_last_run_duration_seconds %f" % report['duration_seconds'],
+        "# HELP ta_helper_last_run_success Whether the last ta-helper run finished without errors.",
+        "# TYPE ta_helper_last_run_success gauge",
+        "ta_helper_last_run_success %d" % bool(report['success']),
+        "# HELP ta_helper_phase_seconds Seconds the last run spent in each phase, summed over workers.",
+        "# TYPE ta_helper_phase_seconds gauge"
+    ]
+    lines += ['ta_helper_phase_seconds{phase="%s"} %f' % (name, phase['seconds']) for name, phase in report['phases'].items()]
+    lines += [
+        "# HELP ta_helper_phase_calls Times the last run entered each phase.",
+        "# TYPE ta_helper_phase_calls gauge"
+    ]
+    lines += ['ta_helper_phase_calls{phase="%s"} %d' % (name, phase['calls']) for name, phase in report['phases'].items()]
+    for name, value in report['counters'].items():
+        lines += [
+            "# HELP ta_helper_%s Last run's %s." % (name, name.replace('_', ' ')),
+            "# TYPE ta_helper_%s gauge" % name,
+            "ta_helper_%s %d" % (name, value)
+        ]
+    return "\n".join(lines) + "\n"
+
+def write_atomic(path, content):
+    # Scrapers and readers never see a half-written file. The temporary name
+    # must not end in .prom, or the textfile collector would pick it up.
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+def write_report(report, json_path="", prometheus_path=""):
+    if json_path:
+        write_atomic(json_path, json.dumps(report, indent=2) + "\n")
+    if prometheus_path:
+        write_atomic(prometheus_path, prometheus_text(report))
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import string
+import tempfile
+
+# Written NFOs get the same permissions open() would give them.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+# NFO layouts for media managers, compiled once and filled in per channel, playlist and video.
+TVSHOW_TEMPLATE = string.Template("<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"yes\"?>\n" +
+    "<tvshow>\n\t" +
+    "<plot>$plot</plot>\n\t" +
+    "<outline>$plot</outline>\n\t" +
+    "<title>$title</title>\n\t" +
+    "<originaltitle>$originaltitle</originaltitle>\n\t" +
+    "<year>$year</year>\n\t" +
+    "<premiered>$date</premiered>\n\t" +
+    "<releasedate>$date</releasedate>\n\t" +
+    "<art>\n\t\t<poster>$poster</poster>\n\t</art>\n\t" +
+    "<youtubemetadataid>$id</youtubemetadataid>\n" +
+    "</tvshow>")
+
+SEASON_TEMPLATE = string.Template("<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"yes\"?>\n" +
+    "<season>\n\t" +
+    "<plot>$plot</plot>\n\t" +
+    "<outline>$plot</outline>\n\t" +
+    "<title>$title</title>\n\t" +
+    "<year>$year</year>\n\t" +
+    "<premiered>$date</premiered>\n\t" +
+    "<releasedate>$date</releasedate>\n\t" +
+    "<art>\n\t\t<poster>$poster</poster>\n\t</art>\n\t" +
+    "<seasonnumber>$season</seasonnumber>\n\t" +
+    "<youtubemetadataid>$id</youtubemetadataid>\n" +
+    "</season>")
+
+VIDEO_TEMPLATE = string.Template("<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"yes\"?>\n" +
+    "<$tag>\n\t" +
+    "<plot>$plot</plot>\n\t" +
+    "<title>$title</title>\n\t" +
+    "<director>$director</director>\n\t" +
+    "<year>$year</year>\n\t" +
+    "<premiered>$date</premiered>\n\t" +
+    "<releasedate>$date</releasedate>\n\t" +
+    "<youtubemetadataid>$id</youtubemetadataid>\n\t" +
+    "<art>\n\t\t<poster>$poster</poster>\n\t</art>\n\t" +
+    "<episode>$episode</episode>\n\t" +
+    "<season>$season</season>\n" +
+    "</$tag>")
+
+def xmlesc(s):
+    if not s:
+        return ""
+    s = s.replace("&", "&amp;")
+    s = s.replace("<", "&lt;")
+    s = s.replace(">", "&gt;")
+    s = s.replace('"', "&quot;")
+    s = s.replace("'", "&apos;")
+    return s
+
+def format_desc(s):
+    if not s:
+        return ""
+    s = s.replace("\n", "<br>\n")
+    return s
+
+def render_tvshow(chan_data, chan_name, poster):
+    return TVSHOW_TEMPLATE.substitute(
+        plot=xmlesc(format_desc(chan_data.channel_description or "")),
+        title=xmlesc(chan_data.channel_name),
+        originaltitle=xmlesc(chan_name),
+        year=chan_data.channel_last_refresh[:4],
+        date=chan_data.channel_last_refresh[:10],
+        poster=poster,
+        id=chan_data.channel_id)
+
+def render_season(playlist_data, season_num, poster):
+    return SEASON_TEMPLATE.substitute(
+        plot=xmlesc(format_desc(playlist_data.playlist_description or "")),
+        title=xmlesc(playlist_data.playlist_name),
+        year=playlist_data.playlist_last_refresh[:4],
+        date=playlist_data.playlist_last_refresh[:10],
+        poster=poster,
+        season=season_num,
+        id=playlist_data.playlist_id)
+
+def render_video(video_meta_data, tag, poster, episode_num, season_num):
+    return VIDEO_TEMPLATE.substitute(
+        tag=tag,
+        plot=xmlesc(format_desc(video_meta_data.description)),
+        title=xmlesc(video_meta_data.title),
+        director=xmlesc(video_meta_data.channel_name),
+        year=video_meta_data.published[:4],
+        date=video_meta_data.published[:10],
+        id=video_meta_data.youtube_id,
+        poster=poster,
+        episode=episode_num,
+        season=season_num)
+
+def digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+def is_current(path, content):
+    # Whether the NFO on disk already holds exactly this content.
+    try:
+        with open(path, "rb") as f:
+            return digest(f.read()) == digest(content.encode("utf-8"))
+    except FileNotFoundError:
+        return False
+
+def write(path, content):
+    # Write through a temporary file in the same folder, so readers never see a partial NFO.
+    folder, filename = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix="." + filename + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content.encode("utf-8"))
+        os.chmod(temp_path, 0o666 & ~UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,125 @@
+import logging
+import queue
+import threading
+import time
+
+# Notification digests: one message per video, per synced channel, or per whole run.
+DIGEST_MODES = ['off', 'channel', 'run']
+
+def video_section(video_meta_data, ta_server):
+    video_url = ta_server + "/video/" + video_meta_data.youtube_id
+    body = "\n\n<b>Video Title:</b> " + video_meta_data.title  + "<br>" + '\n'
+    body += "\n<b>Video Date:</b> " + video_meta_data.published + "<br>" + '\n'
+    body += "\n<b>Video Views:</b> " + str(video_meta_data.view_count) + "<br>" + '\n'
+    body += "\n<b>Video Likes:</b> " + str(video_meta_data.like_count) + "<br>" + '\n\n'
+    body += "\n<b>Video Link:</b> <a href=\"" + video_url + "\">" + video_url + "</a><br>" + '\n'
+    body += "\n<b>Video Desc.:</b>\n\n<pre>" + video_meta_data.description + '</pre></br>\n\n'
+    return body
+
+def html_page(title, content):
+    email_body = '<!DOCTYPE PUBLIC “-//W3C//DTD XHTML 1.0 Transitional//EN” '
+    email_body += '“https://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd”>' + '\n'
+    email_body += '<html xmlns="http://www.w3.org/1999/xhtml">' + '\n'
+    email_body += '<head>' + '\n\t'
+    email_body += '<title>' + title + '</title>' + '\n'
+    email_body += '</head>' + '\n'
+    email_body += '<body>'
+    email_body += content
+    email_body += '\n</body>\n</html>'
+    return email_body
+
+class Notifier:
+    # Sends new video notifications from a background thread, so syncs never wait on delivery.
+    # add() queues the new videos of a synced channel, flush() marks the end of a run.
+
+    def __init__(self, apprise_link, ta_server, digest, logger, metrics=None):
+        self.apprise_link = apprise_link
+        self.ta_server = ta_server
+        self.digest = digest
+        self.logger = logger
+        self.metrics = metrics
+        self.queue = queue.Queue()
+        # New videos held back for the run digest.
+        self.held = []
+        self.lock = threading.Lock()
+        # Started with the first notification, so runs without new videos never load apprise.
+        self.started = False
+
+    def put(self, videos):
+        with self.lock:
+            if not self.started:
+                threading.Thread(target=self.worker, daemon=True).start()
+                self.started = True
+        self.queue.put(videos)
+
+    def add(self, videos):
+        if not videos:
+            return
+        if self.digest == 'off':
+            for video in videos:
+                self.put([video])
+        elif self.digest == 'channel':
+            self.put(list(videos))
+        else:
+            with self.lock:
+                self.held.extend(videos)
+
+    def flush(self):
+        with self.lock:
+            held, self.held = self.held, []
+        if held:
+            self.put(held)
+
+    def wait(self):
+        # Block until everything queued is delivered, before a one-off run exits.
+        self.flush()
+        self.queue.join()
+
+    def message(self, videos):
+        if len(videos) == 1:
+            video = videos[0]
+            self.logger.info("Sending new video notification %s.", video.youtube_id)
+            title = "[TA] New video from " + video.channel_name
+            return title, html_page(video.title, video_section(video, self.ta_server))
+
+        channels = list(dict.fromkeys(video.channel_name for video in videos))
+        self.logger.info("Sending notification digest of %d new videos.", len(videos))
+        if len(channels) == 1:
+            title = "[TA] %d new videos from %s" % (len(videos), channels[0])
+        else:
+            title = "[TA] %d new videos from %d channels" % (len(videos), len(channels))
+        content = ""
+        for channel in channels:
+            content += "\n\n<h2>" + channel + "</h2>\n"
+            content += "".join(video_section(video, self.ta_server) for video in videos if video.channel_name == channel)
+        return title, html_page(title, content)
+
+    def worker(self):
+        # apprise takes a while to import, only load it once there is something to send.
+        import apprise
+        apobj = apprise.Apprise()
+        apobj.add(self.apprise_link)
+        while True:
+            videos = self.queue.get()
+            start = time.monotonic()
+            sent = False
+            try:
+                title, body = self.message(videos)
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    # Dump for local debug viewing
+                    import html2text
+                    pretty_text = html2text.HTML2Text()
+                    pretty_text.ignore_links = True
+                    pretty_text.body_width = 200
+                    self.logger.debug(pretty_text.handle(body))
+                    self.logger.debug(body)
+                sent = apobj.notify(body=body, title=title)
+                if not sent:
+                    self.logger.error("Failed to send notification \"%s\".", title)
+            except Exception as error:
+                self.logger.error("Failed to send notification: %s", error)
+            finally:
+                if self.metrics is not None:
+                    self.metrics.add_phase_time('notify', time.monotonic() - start)
+                    self.metrics.count('notifications_sent' if sent else 'notifications_failed')
+                self.queue.task_done()
@@ -0,0 +1,161 @@
+from . import nfo
+import os
+import shutil
+import stat
+
+# Operations a plan may hold, in the order they are reported.
+OPS = ['mkdir', 'create', 'retarget', 'link', 'relink', 'rename', 'write', 'remove', 'rmtree']
+
+def is_link_of(path, target):
+    # Whether path is a regular file that is another name of the file at target.
+    try:
+        current = os.lstat(path)
+        wanted = os.stat(target)
+    except OSError:
+        return False
+    return stat.S_ISREG(current.st_mode) and (current.st_dev, current.st_ino) == (wanted.st_dev, wanted.st_ino)
+
+class Plan:
+    # Filesystem changes needed to bring part of TARGET_FOLDER to its desired state.
+    # Each method compares the desired state with the current tree and only queues
+    # an operation when they differ, apply() then carries them out in order.
+
+    def __init__(self):
+        self.ops = []
+        self.unchanged = 0
+        # Position of the operation queued to make each new file, see move().
+        self.made = {}
+
+    def folder(self, path):
+        if os.path.isdir(path):
+            self.unchanged += 1
+            return None
+        self.ops.append(('mkdir', path, None))
+        return 'mkdir'
+
+    def symlink(self, path, target):
+        try:
+            current = os.readlink(path)
+        except FileNotFoundError:
+            current = None
+        except OSError:
+            # Something other than a symlink is in the way, replace it.
+            current = ''
+
+        if current == target:
+            self.unchanged += 1
+            return None
+
+        op = 'create' if current is None else 'retarget'
+        if op == 'create':
+            self.made[path] = len(self.ops)
+        self.ops.append((op, path, target))
+        return op
+
+    def hardlink(self, path, target):
+        # Like symlink(), but path becomes a hardlink of the file at target.
+        if is_link_of(path, target):
+            self.unchanged += 1
+            return None
+
+        op = 'relink' if os.path.lexists(path) else 'link'
+        if op == 'link':
+            self.made[path] = len(self.ops)
+        self.ops.append((op, path, target))
+        return op
+
+    def write(self, path, content):
+        if nfo.is_current(path, content):
+            self.unchanged += 1
+            return None
+        self.made[path] = len(self.ops)
+        self.ops.append(('write', path, content))
+        return 'write'
+
+    def makes(self, path):
+        # Whether path is a new file this plan makes from scratch.
+        return path in self.made
+
+    def move(self, old_path, path):
+        # Reuse the file at old_path for the new file queued at path, by renaming it in place of
+        # making it. The symlink target, hardlinked file or NFO content is only updated on top if it differs.
+        i = self.made.pop(path)
+        op, path, arg = self.ops[i]
+        self.ops[i] = ('rename', old_path, path)
+        if op == 'create' and not (os.path.islink(old_path) and os.readlink(old_path) == arg):
+            self.ops.append(('retarget', path, arg))
+        elif op == 'link' and not is_link_of(old_path, arg):
+            self.ops.append(('relink', path, arg))
+        elif op == 'write' and not nfo.is_current(old_path, arg):
+            self.ops.append(('write', path, arg))
+        return 'rename'
+
+    def remove(self, path):
+        if not os.path.lexists(path):
+            return None
+        self.ops.append(('remove', path, None))
+        return 'remove'
+
+    def remove_folder(self, path):
+        self.ops.append(('rmtree', path, None))
+        return 'rmtree'
+
+    def counts(self):
+        counts = dict.fromkeys(OPS, 0)
+        for op, path, arg in self.ops:
+            counts[op] += 1
+        counts['unchanged'] = self.unchanged
+        return counts
+
+    def changes(self):
+        # What the plan does to each path, as ('created' | 'modified' | 'deleted', path) pairs.
+        for op, path, arg in self.ops:
+            if op == 'rename':
+                yield 'deleted', path
+                yield 'created', arg
+            elif op in ['mkdir', 'create', 'link']:
+                yield 'created', path
+            elif op in ['retarget', 'relink', 'write']:
+                yield 'modified', path
+            else:
+                yield 'deleted', path
+
+    def describe(self):
+        for op, path, arg in self.ops:
+            if op in ['create', 'retarget', 'link', 'relink', 'rename']:
+                yield "%-8s %s -> %s" % (op, path, arg)
+            else:
+                yield "%-8s %s" % (op, path)
+
+    def apply(self):
+        for op, path, arg in self.ops:
+            if op == 'mkdir':
+                os.makedirs(path, exist_ok=True)
+            elif op == 'create':
+                os.symlink(arg, path)
+            elif op == 'retarget':
+                os.remove(path)
+                os.symlink(arg, path)
+            elif op == 'link':
+                os.link(arg, path)
+            elif op == 'relink':
+                # Link under a temporary name first, so path is never missing.
+                folder, filename = os.path.split(path)
+                temp_path = os.path.join(folder, "." + filename + ".tmp")
+                try:
+                    os.remove(temp_path)
+                except FileNotFoundError:
+                    pass
+                os.link(arg, temp_path)
+                os.replace(temp_path, path)
+            elif op == 'rename':
+                os.replace(path, arg)
+            elif op == 'write':
+                nfo.write(path, arg)
+            elif op == 'remove':
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            elif op == 'rmtree':
+                shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import subprocess
+
+def file_version(path):
+    # What a file's analysis is tied to, the inode and modification time of the media file a symlink points at.
+    # Returns None if the target is gone.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+def analyse(path, command):
+    # Run the analyser on one file. Returns its output, or raises CalledProcessError.
+    return subprocess.run(command + [path], capture_output=True, text=True, check=True).stdout.strip()
+
+def run(state, paths, command, workers, logger, metrics=None):
+    # Analyse the files at paths that are new or changed since they were last analysed, workers at a time.
+    # Returns how many files were analysed, failed and were up to date.
+    versions = {path: file_version(path) for path in paths}
+    known = state.get_replaygain(paths)
+    todo = [path for path, version in versions.items() if version is not None and known.get(path) != version]
+    current = len([path for path, version in versions.items() if version is not None and known.get(path) == version])
+    if not todo:
+        return 0, 0, current
+
+    logger.info("Analysing ReplayGain of %d files\u2026", len(todo))
+    analysed = failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replaygain") as executor:
+        futures = {executor.submit(analyse, path, command): path for path in todo}
+        for future, path in futures.items():
+            try:
+                result = future.result()
+            except (OSError, subprocess.CalledProcessError) as error:
+                logger.error("ReplayGain analysis of \"%s\" failed: %s", path, getattr(error, 'stderr', None) or error)
+                failed += 1
+                continue
+            # Writing the tags changes the file, remember it as it is now.
+            version = file_version(path)
+            if version is not None:
+                state.put_replaygain(path, version, result)
+            analysed += 1
+
+    if metrics is not None:
+        metrics.count('replaygain_analysed', analysed)
+        metrics.count('replaygain_failed', failed)
+    return analysed, failed, current
@@ -0,0 +1,63 @@
+import threading
+import time
+
+class RunQueue:
+    # Triggers waiting for the next run, merged into one, and the status of the runs so far.
+    # Shared by the trigger's queue of ta-helper processes and the in-process daemon, which only
+    # differ in when they start a run and how they run it.
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = None
+        self.first_trigger = 0
+        self.last_trigger = 0
+        self.running = False
+        self.runs = 0
+        self.last_duration = None
+        self.last_exit_code = None
+        self.last_finished = None
+
+    def add(self, video_ids, channel_ids):
+        with self.cond:
+            now = time.monotonic()
+            if self.pending is None:
+                self.pending = {'full': False, 'videos': {}, 'channels': {}}
+                self.first_trigger = now
+            # A trigger that does not say what changed needs a full run.
+            if not video_ids and not channel_ids:
+                self.pending['full'] = True
+            self.pending['videos'].update(dict.fromkeys(video_ids))
+            self.pending['channels'].update(dict.fromkeys(channel_ids))
+            self.last_trigger = now
+            self.cond.notify()
+
+    def take(self):
+        # Start a run of the pending work, None if there is none. Called with cond held.
+        work = self.pending
+        self.pending = None
+        self.running = True
+        return work
+
+    def finish(self, start, exit_code):
+        with self.cond:
+            self.running = False
+            self.runs += 1
+            self.last_duration = time.monotonic() - start
+            self.last_exit_code = exit_code
+            self.last_finished = time.time()
+
+    def status(self):
+        with self.cond:
+            queued = self.pending is not None
+            return {
+                'running': self.running,
+                'queued': queued,
+                'queue_depth': int(self.running) + int(queued),
+                'pending_full': queued and self.pending['full'],
+                'pending_videos': len(self.pending['videos']) if queued else 0,
+                'pending_channels': len(self.pending['channels']) if queued else 0,
+                'runs': self.runs,
+                'last_run_duration': self.last_duration,
+                'last_run_exit_code': self.last_exit_code,
+                'last_run_finished': self.last_finished
+            }
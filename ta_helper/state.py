@@ -0,0 +1,203 @@
+from .catalog import Video
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+class State:
+    # Persistent ta-helper state, kept in a single SQLite database.
+
+    def __init__(self, path, max_age=0, max_videos=0, readonly=False):
+        # Channels are synced from several threads, they share the connection one call at a time.
+        # Shards in other processes wait for each other's writes.
+        if readonly:
+            # Work on a copy in memory, e.g. for a dry run, leaving the database file as it is or absent.
+            self.db = sqlite3.connect(":memory:", check_same_thread=False)
+            if os.path.exists(path):
+                source = sqlite3.connect("file:" + urllib.parse.quote(path) + "?mode=ro", uri=True, timeout=60)
+                source.backup(self.db)
+                source.close()
+        else:
+            self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.max_age = max_age
+        self.max_videos = max_videos
+        self.db.execute("CREATE TABLE IF NOT EXISTS videos ("
+            "youtube_id TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS videos_fetched_at ON videos (fetched_at)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS markers ("
+            "kind TEXT NOT NULL, id TEXT NOT NULL, signature TEXT NOT NULL, PRIMARY KEY (kind, id))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS manifest ("
+            "path TEXT PRIMARY KEY, kind TEXT NOT NULL, channel_id TEXT NOT NULL, youtube_id TEXT, source TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS manifest_channel_id ON manifest (channel_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS manifest_youtube_id ON manifest (youtube_id)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS episodes ("
+            "channel_id TEXT NOT NULL, playlist_id TEXT NOT NULL, youtube_id TEXT NOT NULL, episode INTEGER NOT NULL, "
+            "PRIMARY KEY (channel_id, playlist_id, youtube_id))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS replaygain ("
+            "path TEXT PRIMARY KEY, inode INTEGER NOT NULL, mtime INTEGER NOT NULL, result TEXT, analysed_at REAL NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS artwork ("
+            "source TEXT PRIMARY KEY, mtime INTEGER NOT NULL, path TEXT NOT NULL)")
+        self.db.commit()
+
+    def get_videos(self, youtube_ids):
+        # Return cached, still fresh videos for the given ids, as Video records.
+        with self.lock:
+            found = {}
+            oldest = time.time() - self.max_age if self.max_age else 0
+            youtube_ids = list(youtube_ids)
+            # Stay below SQLite's bound parameter limit.
+            for i in range(0, len(youtube_ids), 500):
+                chunk = youtube_ids[i:i + 500]
+                rows = self.db.execute("SELECT youtube_id, data FROM videos WHERE fetched_at >= ? AND youtube_id IN (" +
+                    ",".join("?" * len(chunk)) + ")", [oldest] + chunk)
+                for youtube_id, data in rows:
+                    found[youtube_id] = Video(json.loads(data))
+            return found
+
+    def put_videos(self, videos):
+        with self.lock:
+            now = time.time()
+            self.db.executemany("INSERT OR REPLACE INTO videos (youtube_id, data, fetched_at) VALUES (?, ?, ?)",
+                [(video.youtube_id, json.dumps(video.to_json()), now) for video in videos])
+            self.db.commit()
+
+    def invalidate_videos(self, youtube_ids=None):
+        with self.lock:
+            if youtube_ids:
+                deleted = self.db.executemany("DELETE FROM videos WHERE youtube_id = ?",
+                    [(youtube_id,) for youtube_id in youtube_ids]).rowcount
+            else:
+                deleted = self.db.execute("DELETE FROM videos").rowcount
+            self.db.commit()
+            return deleted
+
+    def evict_videos(self):
+        # Bound the cache size by dropping the least recently fetched videos.
+        with self.lock:
+            if not self.max_videos:
+                return 0
+            deleted = self.db.execute("DELETE FROM videos WHERE youtube_id IN ("
+                "SELECT youtube_id FROM videos ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)", (self.max_videos,)).rowcount
+            self.db.commit()
+            return deleted
+
+    def get_markers(self, kind):
+        # Change markers recorded when a channel or playlist was last synced, keyed by its id.
+        with self.lock:
+            return dict(self.db.execute("SELECT id, signature FROM markers WHERE kind = ?", (kind,)))
+
+    def put_marker(self, kind, id, signature):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO markers (kind, id, signature) VALUES (?, ?, ?)", (kind, id, signature))
+            self.db.commit()
+
+    def delete_marker(self, kind, id):
+        with self.lock:
+            self.db.execute("DELETE FROM markers WHERE kind = ? AND id = ?", (kind, id))
+            self.db.commit()
+
+    def get_manifest(self, channel_id):
+        # Files and folders made for a channel, as (path, kind, youtube_id, source) rows.
+        with self.lock:
+            return self.db.execute("SELECT path, kind, youtube_id, source FROM manifest WHERE channel_id = ?", (channel_id,)).fetchall()
+
+    def get_video_paths(self, channel_id, youtube_ids):
+        # Reverse index of the given videos to every file the channel has for them, as (path, kind, youtube_id, source) rows.
+        found = []
+        youtube_ids = list(youtube_ids)
+        with self.lock:
+            for i in range(0, len(youtube_ids), 500):
+                chunk = youtube_ids[i:i + 500]
+                found.extend(self.db.execute("SELECT path, kind, youtube_id, source FROM manifest WHERE youtube_id IN (" +
+                    ",".join("?" * len(chunk)) + ") AND channel_id = ?", chunk + [channel_id]))
+        return found
+
+    def get_video_channels(self, youtube_ids):
+        # Channels with files for each of the given videos, as {youtube_id: {channel_id, ...}}.
+        found = {}
+        youtube_ids = list(youtube_ids)
+        with self.lock:
+            for i in range(0, len(youtube_ids), 500):
+                chunk = youtube_ids[i:i + 500]
+                for youtube_id, channel_id in self.db.execute("SELECT DISTINCT youtube_id, channel_id FROM manifest WHERE youtube_id IN (" +
+                        ",".join("?" * len(chunk)) + ")", chunk):
+                    found.setdefault(youtube_id, set()).add(channel_id)
+        return found
+
+    def get_manifest_channels(self):
+        with self.lock:
+            return {row[0] for row in self.db.execute("SELECT DISTINCT channel_id FROM manifest")}
+
+    def put_manifest(self, channel_id, rows):
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO manifest (path, kind, channel_id, youtube_id, source) VALUES (?, ?, ?, ?, ?)",
+                [(path, kind, channel_id, youtube_id, source) for path, kind, youtube_id, source in rows])
+            self.db.commit()
+
+    def delete_manifest(self, paths):
+        with self.lock:
+            self.db.executemany("DELETE FROM manifest WHERE path = ?", [(path,) for path in paths])
+            self.db.commit()
+
+    def get_episodes(self, channel_id, playlist_id):
+        # Episode numbers given to the videos of a season, keyed by youtube_id. The channel's own videos have playlist_id "".
+        with self.lock:
+            return dict(self.db.execute("SELECT youtube_id, episode FROM episodes WHERE channel_id = ? AND playlist_id = ?",
+                (channel_id, playlist_id)))
+
+    def put_episodes(self, channel_id, playlist_id, episodes):
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO episodes (channel_id, playlist_id, youtube_id, episode) VALUES (?, ?, ?, ?)",
+                [(channel_id, playlist_id, youtube_id, episode) for youtube_id, episode in episodes])
+            self.db.commit()
+
+    def delete_episodes(self, channel_id):
+        with self.lock:
+            self.db.execute("DELETE FROM episodes WHERE channel_id = ?", (channel_id,))
+            self.db.commit()
+
+    def get_replaygain(self, paths):
+        # The (inode, mtime) each of the given files had when its ReplayGain was last analysed.
+        found = {}
+        paths = list(paths)
+        with self.lock:
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                for path, inode, mtime in self.db.execute("SELECT path, inode, mtime FROM replaygain WHERE path IN (" +
+                        ",".join("?" * len(chunk)) + ")", chunk):
+                    found[path] = (inode, mtime)
+        return found
+
+    def put_replaygain(self, path, version, result):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO replaygain (path, inode, mtime, result, analysed_at) VALUES (?, ?, ?, ?, ?)",
+                (path, version[0], version[1], result, time.time()))
+            self.db.commit()
+
+    def prune_replaygain(self):
+        # Forget files ta-helper no longer has.
+        with self.lock:
+            deleted = self.db.execute("DELETE FROM replaygain WHERE path NOT IN (SELECT path FROM manifest)").rowcount
+            self.db.commit()
+            return deleted
+
+    def get_artwork(self):
+        # The stored file each cache file was materialized to, and the mtime it had then, as {source: (mtime, path)}.
+        with self.lock:
+            return {source: (mtime, path) for source, mtime, path in self.db.execute("SELECT source, mtime, path FROM artwork")}
+
+    def put_artwork(self, source, mtime, path):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO artwork (source, mtime, path) VALUES (?, ?, ?)", (source, mtime, path))
+            self.db.commit()
+
+    def delete_artwork(self, sources):
+        with self.lock:
+            self.db.executemany("DELETE FROM artwork WHERE source = ?", [(source,) for source in sources])
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,1432 @@
+from .api import ApiClient, ApiError
+import argparse
+from .artwork import ArtworkStore, MODES as ARTWORK_MODES
+from .catalog import Catalog, Playlist, Video
+from collections import deque
+from dotenv import find_dotenv, load_dotenv
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+from .metrics import Metrics, write_report
+from . import nfo
+import os
+import re
+from . import replaygain
+from concurrent.futures import ThreadPoolExecutor
+import shlex
+import shutil
+from .notifications import Notifier, DIGEST_MODES
+from .plan import Plan, OPS
+from .runs import RunQueue
+from .state import State
+from .util import strtobool
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def setup_logging():
+    # Only when run, a process importing ta_helper may already have its own handlers.
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter(
+        fmt='%(asctime)s %(filename)s:%(lineno)s %(levelname)-8s %(message)s',
+        datefmt='%d-%b-%y %H:%M:%S'
+    )
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+# Pull configuration details from .env file, in the working directory or next to the checkout.
+load_dotenv(find_dotenv(usecwd=True))
+load_dotenv()
+NOTIFICATIONS_ENABLED = bool(strtobool(os.environ.get("NOTIFICATIONS_ENABLED", "False")))
+GENERATE_NFO = bool(strtobool(os.environ.get("GENERATE_NFO", "False")))
+SYMLINK_SUBS = bool(strtobool(os.environ.get("SYMLINK_SUBS", "False")))
+SUB_FORMAT = str(os.environ.get("SUB_FORMAT", ".vtt"))
+SUB_FORMATS = tuple(sub_format.strip() for sub_format in SUB_FORMAT.split(",") if sub_format.strip())
+GENERATE_SHOWS_NFO = bool(strtobool(os.environ.get("GENERATE_SHOWS_NFO", "False")))
+FROMADDR = str(os.environ.get("MAIL_USER", ""))
+RECIPIENTS = str(os.environ.get("MAIL_RECIPIENTS", ""))
+RECIPIENTS = RECIPIENTS.split(',')
+TA_MEDIA_FOLDER = str(os.environ.get("TA_MEDIA_FOLDER", ""))
+TA_SERVER = str(os.environ.get("TA_SERVER", ""))
+TA_TOKEN = str(os.environ.get("TA_TOKEN", ""))
+TA_CACHE = str(os.environ.get("TA_CACHE", ""))
+TA_CACHE_DOCKER = bool(strtobool(os.environ.get("TA_CACHE_DOCKER", "False")))
+TARGET_FOLDER = str(os.environ.get("TARGET_FOLDER", ""))
+APPRISE_LINK = str(os.environ.get("APPRISE_LINK", ""))
+NOTIFY_DIGEST = str(os.environ.get("NOTIFY_DIGEST", "off")).lower()
+QUICK = bool(strtobool(os.environ.get("QUICK", "True")))
+POSTPROCESS_COMMAND = str(os.environ.get("POSTPROCESS_COMMAND", ""))
+CLEANUP_DELETED_VIDEOS = bool(strtobool(os.environ.get("CLEANUP_DELETED_VIDEOS", "False")))
+FETCH_WORKERS = max(1, int(os.environ.get("FETCH_WORKERS", "8")))
+SYNC_WORKERS = max(1, int(os.environ.get("SYNC_WORKERS", "4")))
+STATE_DB = str(os.environ.get("STATE_DB", TARGET_FOLDER + "/.ta-helper.db"))
+VIDEO_CACHE_DAYS = float(os.environ.get("VIDEO_CACHE_DAYS", "7"))
+VIDEO_CACHE_SIZE = int(os.environ.get("VIDEO_CACHE_SIZE", "200000"))
+DAEMON_INTERVAL = float(os.environ.get("DAEMON_INTERVAL", "300"))
+DAEMON_DEBOUNCE = float(os.environ.get("DAEMON_DEBOUNCE", "0.5"))
+DAEMON_FULL_EVERY = max(1, int(os.environ.get("DAEMON_FULL_EVERY", "12")))
+REPORT_FILE = str(os.environ.get("REPORT_FILE", ""))
+PROMETHEUS_TEXTFILE = str(os.environ.get("PROMETHEUS_TEXTFILE", ""))
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", "30"))
+API_RETRIES = max(0, int(os.environ.get("API_RETRIES", "4")))
+API_BACKOFF = float(os.environ.get("API_BACKOFF", "1"))
+REPLAYGAIN_CHANNELS = [channel.strip() for channel in os.environ.get("REPLAYGAIN_CHANNELS", "").split(",") if channel.strip()]
+REPLAYGAIN_COMMAND = shlex.split(os.environ.get("REPLAYGAIN_COMMAND", "rsgain custom -s i -c a -O"))
+REPLAYGAIN_WORKERS = max(1, int(os.environ.get("REPLAYGAIN_WORKERS", str(os.cpu_count() or 1))))
+ARTWORK_MODE = str(os.environ.get("ARTWORK_MODE", "symlink")).lower()
+ARTWORK_MAX_SIZE = max(0, int(os.environ.get("ARTWORK_MAX_SIZE", "1000")))
+
+logger.setLevel(os.environ.get("LOGLEVEL", "INFO"))
+
+def check_config():
+    global NOTIFY_DIGEST, ARTWORK_MODE
+    setup_logging()
+
+    if TA_CACHE == "":
+        logger.info("No TA_CACHE available so cannot setup symlinks to cache files.")
+
+    if not NOTIFICATIONS_ENABLED:
+        logger.debug("NOTIFICATIONS_ENABLED is set to False in .env settings.")
+
+    if NOTIFY_DIGEST not in DIGEST_MODES:
+        logger.info("Unknown NOTIFY_DIGEST \"%s\", sending one notification per video.", NOTIFY_DIGEST)
+        NOTIFY_DIGEST = 'off'
+
+    if ARTWORK_MODE not in ARTWORK_MODES:
+        logger.info("Unknown ARTWORK_MODE \"%s\", symlinking artwork.", ARTWORK_MODE)
+        ARTWORK_MODE = 'symlink'
+
+    if not GENERATE_SHOWS_NFO:
+        logger.debug("GENERATE_SHOWS_NFO is set to False in .env settings.")
+
+    if not GENERATE_NFO:
+        logger.debug("GENERATE_NFO is et to False in .env settings.")
+
+    if not SYMLINK_SUBS:
+        logger.debug("SYMLINK_SUBS is et to False in .env settings.")
+
+# Timers and counters of the current run, see write_run_report().
+metrics = Metrics()
+
+# Operations of applied plans, by the counter they add to.
+OP_COUNTERS = {
+    'mkdir': 'folders_created',
+    'create': 'symlinks_created',
+    'retarget': 'symlinks_retargeted',
+    'link': 'hardlinks_created',
+    'relink': 'hardlinks_replaced',
+    'rename': 'files_renamed',
+    'write': 'nfos_written',
+    'remove': 'files_removed',
+    'rmtree': 'folders_removed'
+}
+
+# Shared API client, so all API calls reuse pooled connections to TA and back off together when it struggles.
+# Every sync worker may have FETCH_WORKERS requests in flight.
+api = ApiClient(TA_TOKEN, FETCH_WORKERS * SYNC_WORKERS, API_TIMEOUT, API_RETRIES, API_BACKOFF, logger, metrics)
+
+fetch_stats = {'entries': 0, 'cached': 0, 'fetched': 0}
+
+# Filesystem operations planned this run, and whether to only report them.
+plan_stats = dict.fromkeys(OPS + ['unchanged'], 0)
+DRY_RUN = False
+# Set for the shards of a local pool, which hand their changes back instead of post processing.
+CHANGES_FILE = ""
+# Locks taken by lock(), held until the process exits or they are unlocked.
+LOCK_FILE = TARGET_FOLDER + "/.ta-helper.lock"
+held_locks = []
+
+# Channels are synced by several workers at once, counters shared between them take this lock.
+stats_lock = threading.Lock()
+worker_stats = {}
+# Paths this run created, modified or deleted, handed to POSTPROCESS_COMMAND.
+changed_paths = {}
+
+# Opened by open_state(), change markers are loaded on the first sync.
+state = None
+notifier = None
+artwork_store = None
+channel_markers = None
+playlist_markers = None
+# Entries of each playlist as of the last run, and channels to sync even if their markers did not move.
+playlist_entries = None
+dirty_channels = None
+
+def fetch_video(youtube_id):
+    video_url = TA_SERVER + '/api/video/' + youtube_id + "/"
+    logger.debug("Video API: %s", video_url)
+    with metrics.phase('fetch_videos'):
+        video_json = api.get(video_url)
+    return Video(video_json) if video_json else None
+
+def fetch_videos(youtube_ids, catalog):
+    # Resolve metadata for all given videos, only fetching the ones not seen yet.
+    # Videos already in the catalog are reused, the others are added to it.
+    with stats_lock:
+        fetch_stats['entries'] += len(youtube_ids)
+    found = {}
+    for youtube_id in dict.fromkeys(youtube_ids):
+        video = catalog.videos.get(youtube_id)
+        if video is not None:
+            found[youtube_id] = video
+    missing = [youtube_id for youtube_id in dict.fromkeys(youtube_ids) if youtube_id not in found]
+    if missing:
+        # Then try the on-disk cache from previous runs.
+        cached = state.get_videos(missing)
+        with stats_lock:
+            fetch_stats['cached'] += len(cached)
+        for video in cached.values():
+            found[video.youtube_id] = catalog.add_video(video)
+        missing = [youtube_id for youtube_id in missing if youtube_id not in cached]
+
+    if missing:
+        with stats_lock:
+            fetch_stats['fetched'] += len(missing)
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            fetched = [video for video in executor.map(fetch_video, missing) if video is not None]
+        for video in fetched:
+            found[video.youtube_id] = catalog.add_video(video)
+        state.put_videos(fetched)
+
+    return [found.get(youtube_id) for youtube_id in youtube_ids]
+
+def fetch_channel(channel_id):
+    chan_url = TA_SERVER + '/api/channel/' + channel_id + "/"
+    logger.debug("Channel API: %s", chan_url)
+    with metrics.phase('fetch_channels'):
+        return api.get(chan_url)
+
+def fetch_target_channels(youtube_ids, channel_ids, catalog):
+    # Resolve every channel a targeted sync has to walk to pick up changes to the given videos.
+    channel_ids = list(channel_ids)
+    for youtube_id in dict.fromkeys(youtube_ids):
+        # Always ask TA, as the video has most likely just been added or moved.
+        video_data = fetch_video(youtube_id)
+        if video_data is None:
+            logger.info("Video %s not found in TA, ignoring.", youtube_id)
+            continue
+
+        # Cache it for the channel syncs that follow.
+        state.put_videos([video_data])
+        channel_ids.append(video_data.channel_id)
+        # Playlists by other channels may hold the video too.
+        for playlist_id in video_data.playlist:
+            if playlist_id in catalog.playlists:
+                channel_ids.append(catalog.playlists[playlist_id].playlist_channel_id)
+
+    channels_data = []
+    for channel_id in dict.fromkeys(channel_ids):
+        channel = fetch_channel(channel_id)
+        if channel is None:
+            logger.info("Channel %s not found in TA, ignoring.", channel_id)
+            continue
+        channels_data.append(catalog.add_channel(channel))
+
+    return channels_data
+
+def fetch_page(url, params=None, page=1):
+    params = dict(params or {})
+    params['page'] = page
+    # Listing pages are timed per endpoint, e.g. list_videos.
+    with metrics.phase("list_" + url.rstrip("/").rsplit("/", 1)[-1] + "s"):
+        return api.get(url, params)
+
+def iter_pages(url, params=None, page_json=None):
+    # Yield the items of each page of a paginated TA API listing, optionally continuing from an already
+    # fetched first page. The next page downloads while the caller is still busy with the current one.
+    if page_json is None:
+        page_json = fetch_page(url, params)
+
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        while page_json is not None:
+            next_page = None
+            page = page_json['paginate']['current_page'] + 1
+            if page_json['paginate']['last_page']:
+                next_page = prefetch.submit(fetch_page, url, params, page)
+            yield page_json['data']
+            page_json = next_page.result() if next_page else None
+            if next_page and page_json is None:
+                # A shortened listing would have clean-up delete everything on the missing pages.
+                raise ApiError("%s: page %d is missing" % (url, page))
+
+def settings_signature():
+    # Settings that change what a sync makes of the same videos, part of every marker
+    # so QUICK does not skip what was synced with other settings.
+    settings = [GENERATE_NFO, GENERATE_SHOWS_NFO, SYMLINK_SUBS, SUB_FORMATS, TA_MEDIA_FOLDER, TA_CACHE, TA_CACHE_DOCKER, ARTWORK_MODE]
+    return hashlib.sha1(repr(settings).encode()).hexdigest()[:12]
+
+def channel_signature(channel, chan_videos_page):
+    # Markers that move whenever TA refreshes the channel, or adds or removes any of its videos.
+    newest = ""
+    total = 0
+    if chan_videos_page is not None:
+        newest = max((video['published'] for video in chan_videos_page['data']), default="")
+        total = chan_videos_page['paginate'].get('total_hits', len(chan_videos_page['data']))
+    return "|".join([channel.channel_last_refresh or "", newest, str(total), settings_signature()])
+
+def playlist_signature(playlist):
+    # Markers that move whenever TA refreshes the playlist, or its entries or their download state change.
+    entries = ",".join(youtube_id + ("+" if downloaded else "-") for youtube_id, downloaded in playlist.entries)
+    return "|".join([playlist.playlist_last_refresh or "", hashlib.sha1(entries.encode()).hexdigest(), settings_signature()])
+
+def playlist_entry_ids(playlist):
+    # The playlist's entries as remembered between runs, to tell which videos joined or left it.
+    return ",".join(youtube_id for youtube_id, downloaded in playlist.entries)
+
+def media_url(video):
+    return video.media_url.replace('/youtube', '')
+
+def scan_sidecars(folder):
+    # One pass over a media folder, listing the suffixes of the files next to each video
+    # by their name up to the first dot, e.g. {'dQw4w9WgXcQ': ['.en.vtt', '.mp4']}.
+    index = {}
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                stem, dot, suffix = entry.name.partition(".")
+                if dot:
+                    index.setdefault(stem, []).append("." + suffix)
+    except OSError as error:
+        logger.debug("Unable to scan \"%s\": %s", folder, error)
+    return index
+
+def media_sidecars(sidecars, video):
+    # The media folder of a video, its name up to the first dot, its media file's suffix and the suffixes
+    # of every file by that name. sidecars holds the index of each media folder seen so far, so every
+    # folder is only scanned once.
+    folder, filename = os.path.split(TA_MEDIA_FOLDER + media_url(video))
+    if folder not in sidecars:
+        sidecars[folder] = scan_sidecars(folder)
+    stem, dot, media_suffix = filename.partition(".")
+    return folder, stem, "." + media_suffix, sidecars[folder].get(stem, ())
+
+def has_media(sidecars, video):
+    # Whether TA still has the video's media file on disk.
+    folder, stem, media_suffix, suffixes = media_sidecars(sidecars, video)
+    return media_suffix in suffixes
+
+def video_subtitles(sidecars, video):
+    # Subtitles of a video matching SUB_FORMAT, as (suffix, path) pairs.
+    folder, stem, media_suffix, suffixes = media_sidecars(sidecars, video)
+    return [(suffix, folder + "/" + stem + suffix) for suffix in sorted(suffixes)
+        if suffix.endswith(SUB_FORMATS) and suffix != media_suffix]
+
+def record_video_paths(synced_paths, chan_name, playlist_name, video_symlink_name, video, sidecars):
+    # Remember every file a video owns in the target folder, whether it was just made or already there.
+    folder = TARGET_FOLDER + "/" + chan_name + "/" + playlist_name + "/"
+    youtube_id = video.youtube_id
+    video_path = TA_MEDIA_FOLDER + media_url(video)
+    synced_paths.append((folder + video_symlink_name, 'video', youtube_id, video_path))
+    if GENERATE_NFO:
+        synced_paths.append((folder + video_symlink_name.replace('.mp4', '.nfo'), 'nfo', youtube_id, None))
+    if TA_CACHE:
+        synced_paths.append((folder + video_symlink_name.replace('.mp4', '-poster.jpg'), 'poster', youtube_id, cache_path(video.vid_thumb_url)))
+    if SYMLINK_SUBS:
+        for suffix, subtitle_path in video_subtitles(sidecars, video):
+            synced_paths.append((folder + video_symlink_name.replace('.mp4', suffix), 'sub', youtube_id, subtitle_path))
+
+def cache_path(cache):
+    if TA_CACHE_DOCKER:
+        return TA_CACHE + cache.replace("/cache", "", 1)
+    else:
+        return TA_CACHE + cache
+
+def link_artwork(plan, path, image_path):
+    # Put the TA cache image at image_path in place at path, as a symlink or, with ARTWORK_MODE
+    # "materialize", as a hardlink of its copy in the artwork store. Returns path, or '' if there is no image.
+    if ARTWORK_MODE == 'symlink':
+        plan.symlink(path, image_path)
+        return path
+    if DRY_RUN:
+        # Compare with the cache file itself when it was not materialized yet, to leave the store untouched.
+        stored = artwork_store.lookup(image_path) or image_path
+    else:
+        stored = artwork_store.materialize(image_path)
+        if stored is None:
+            return ''
+    plan.hardlink(path, stored)
+    return path
+
+def setup_channel_thumb(plan, chan_name, chan_data):
+    if not TA_CACHE:
+        return ''
+
+    # Link the channel logo from TA docker cache into target folder for media managers
+    # and file explorers. Provide cover.jpg, poster.jpg, folder.jpg and banner.jpg symlinks.
+    channel_thumb_path = cache_path(chan_data.channel_thumb_url)
+    channel_banner_path = cache_path(chan_data.channel_banner_url)
+
+    channel_root = TARGET_FOLDER + "/" + chan_name
+    target_filenames = ["poster.jpg", "cover.jpg", "folder.jpg", "banner.jpg"]
+    for filename in target_filenames:
+        image_path = channel_banner_path if filename == "banner.jpg" else channel_thumb_path
+        linked = link_artwork(plan, channel_root + "/" + filename, image_path)
+        if filename == "folder.jpg":
+            folder_symlink = linked
+
+    logger.debug("Symlink thumb \"%s\" to poster, cover, and folder.jpg files.", channel_thumb_path)
+    return folder_symlink
+
+def setup_channel_resources(plan, chan_name, chan_data):
+    folder_symlink = setup_channel_thumb(plan, chan_name, chan_data)
+    if GENERATE_SHOWS_NFO:
+        # Generate tvshow.nfo for media managers, no TA_CACHE required.
+        if plan.write(TARGET_FOLDER + "/" + chan_name + "/" + "tvshow.nfo", nfo.render_tvshow(chan_data, chan_name, folder_symlink)):
+            logger.info("Generating tvshow.nfo for channel \"%s\".", chan_name)
+
+def setup_playlist_thumb(plan, chan_name, playlist_name, playlist_data):
+    if not TA_CACHE or playlist_data.playlist_name == 'Videos':
+        return ''
+
+    # Link the playlist thumb from TA docker cache into target folder for media managers
+    # and file explorers. Provide folder.jpg symlink.
+    playlist_thumb_path = cache_path(playlist_data.playlist_thumbnail)
+    folder_symlink = link_artwork(plan, TARGET_FOLDER + "/" + chan_name + "/" + playlist_name + "/" + "folder.jpg", playlist_thumb_path)
+
+    logger.debug("Symlink thumb \"%s\" to folder.jpg file.", playlist_thumb_path)
+    return folder_symlink
+
+def setup_channel_playlist_resources(plan, chan_name, playlist_name, playlist_data, season_num):
+    folder_symlink = setup_playlist_thumb(plan, chan_name, playlist_name, playlist_data)
+    if GENERATE_SHOWS_NFO:
+        # Generate season.nfo for media managers, no TA_CACHE required.
+        season_nfo = nfo.render_season(playlist_data, season_num, folder_symlink)
+        if plan.write(TARGET_FOLDER + "/" + chan_name + "/" + playlist_name + "/" + "season.nfo", season_nfo):
+            logger.info("Generating season.nfo for playlist \"%s\".", playlist_name)
+
+def setup_video_thumb(plan, chan_name, playlist_name, video_symlink_name, video_meta_data):
+    if not TA_CACHE:
+        return ''
+
+    # Link the video thumb from TA docker cache into target folder for media managers
+    # and file explorers. Provide -poster.jpg symlink.
+    video_thumb_path = cache_path(video_meta_data.vid_thumb_url)
+
+    poster_title = video_symlink_name.replace('.mp4', '-poster.jpg')
+    poster_symlink = link_artwork(plan, TARGET_FOLDER + "/" + chan_name + "/" + playlist_name + "/" + poster_title, video_thumb_path)
+
+    logger.debug("Symlink thumb \"%s\" to -poster.jpg file.", video_thumb_path)
+    return poster_symlink
+
+def generate_video_nfo(plan, chan_name, playlist_name, video_symlink_name, video_meta_data, episode_num, season_num):
+    poster_symlink = setup_video_thumb(plan, chan_name, playlist_name, video_symlink_name, video_meta_data)
+    nfo_tag = "episodedetails" if GENERATE_SHOWS_NFO else "musicvideo"
+    if GENERATE_NFO:
+        # Create an NFO file for media managers, or refresh it when TA's metadata changed.
+        nfo_filename = video_symlink_name.replace('.mp4', '.nfo')
+        video_nfo = nfo.render_video(video_meta_data, nfo_tag, poster_symlink, episode_num, season_num)
+        if plan.write(TARGET_FOLDER + "/" + chan_name + "/" + playlist_name + "/" + nfo_filename, video_nfo):
+            logger.info("Generating .nfo file for %s.", video_meta_data.youtube_id)
+
+def generate_video_subs(plan, chan_name, playlist_name, video_symlink_name, video_meta_data, sidecars):
+    # Create symlinks to the video's subtitles in every language TA has, including ones added since the video was.
+    subtitles = video_subtitles(sidecars, video_meta_data)
+    for suffix, subtitle_path in subtitles:
+        subtitle_symlink = TARGET_FOLDER + "/" + chan_name + "/" + playlist_name + "/" + video_symlink_name.replace(".mp4", suffix)
+        if plan.symlink(subtitle_symlink, subtitle_path):
+            logger.debug("Symlink %s subtitle for %s.", suffix, video_meta_data.youtube_id)
+    if not subtitles:
+        logger.debug("%s does not have %s subtitles.", video_meta_data.youtube_id, SUB_FORMAT)
+
+def cleanup_after_deleted_videos():
+    logger.debug("===")
+    logger.info("Checking for broken symlinks and hanging extra files\u2026")
+
+    # Subtitles in any language, whatever SUB_FORMAT was when they were made.
+    extras = [r"\.nfo", r"-poster\.jpg", r"(\.[\w-]+)?\.(vtt|srt|ass)"] + [re.escape(sub_format) for sub_format in SUB_FORMATS]
+    extras_pattern = re.compile("(" + "|".join(extras) + ")$", re.IGNORECASE)
+    broken = []
+    empty_subfolders = []
+    for root, dirs, files in os.walk(TARGET_FOLDER):
+        # Ignore hidden folders, such as .git and the artwork store.
+        dirs[:] = [dirname for dirname in dirs if not dirname.startswith('.')]
+
+        has_working_symlink = False
+        for filename in files:
+            path = os.path.join(root, filename)
+            # Check if the file is a video's extra file.
+            if extras_pattern.search(filename):
+                if filename in ["tvshow.nfo", "season.nfo"]:
+                    continue
+                # Check if there is a corresponding video file and if not, delete the extra file.
+                expected_video = extras_pattern.sub(".mp4", path)
+                if not os.path.exists(expected_video):
+                    # Queue the hanging extra file for deletion.
+                    broken.append(path)
+            elif os.path.islink(path):
+                # We've found a symlink.
+                target_path = os.readlink(path)
+                # Resolve relative symlinks
+                if not os.path.isabs(target_path):
+                    target_path = os.path.join(os.path.dirname(path), target_path)
+                if os.path.exists(target_path):
+                    has_working_symlink = True
+                else:
+                    # The symlink is broken.
+                    broken.append(path)
+            elif ARTWORK_MODE == 'materialize' and filename.endswith(".jpg"):
+                # Materialized artwork keeps its folder, like a working symlink would.
+                has_working_symlink = True
+            else:
+                # If it's not a symlink or hanging extra file, we're not interested.
+                logger.debug("No need to clean-up \"%s\".", path)
+
+        if root != TARGET_FOLDER and not len(dirs) and not has_working_symlink:
+            empty_subfolders.append(root)
+
+    if broken == []:
+        logger.info("No broken files found.")
+    else:
+        logger.info('%d broken files found, cleaning up\u2026', len(broken))
+        for link in broken:
+            # Here we need to delete the NFO file and video and subtitle symlinks
+            # associated with the deleted video.
+            os.remove(link)
+            record_changes([('deleted', link)])
+            logger.info("Deleted broken file: %s", link)
+
+    if not shutil.rmtree.avoids_symlink_attacks:
+        logger.info("Unable to clean-up empty folders due to unsafe shtuil.rmtree().")
+        return False
+
+    if empty_subfolders == []:
+        logger.info("No empty sub-folders found.")
+    else:
+        logger.info("%d empty sub-folders found, cleaning up\u2026", len(empty_subfolders))
+        for subfolder in empty_subfolders:
+            shutil.rmtree(subfolder)
+            record_changes([('deleted', subfolder)])
+            logger.info("Deleted empty sub-folder: %s", subfolder)
+
+    # Clean-up empty channel folders.
+    for entry in os.scandir(TARGET_FOLDER):
+        if not entry.is_dir() or entry.name.startswith('.'):
+            continue
+
+        has_subfolders = False
+        for _entry in os.scandir(entry):
+            if _entry.is_dir():
+                has_subfolders = True
+                break
+
+        if not has_subfolders:
+            shutil.rmtree(entry)
+            record_changes([('deleted', entry.path)])
+            logger.info("Deleted empty channel folder: %s", entry.path)
+
+def remove_stale(plan, rows):
+    # Plan the removal of files and folders an earlier sync made. Returns the manifest rows to drop once applied,
+    # folders left in place keep theirs so a later run can still clean them up.
+    removed_folders = []
+    removed = []
+    for row in sorted(rows):
+        path, kind, youtube_id, source = row
+        if any(path.startswith(folder + "/") for folder in removed_folders):
+            removed.append(row)
+            continue
+        if kind in ['channel', 'folder']:
+            if not shutil.rmtree.avoids_symlink_attacks:
+                logger.info("Unable to clean-up \"%s\" due to unsafe shutil.rmtree().", path)
+                continue
+            plan.remove_folder(path)
+            removed_folders.append(path)
+            logger.info("Deleting stale folder: %s", path)
+        elif plan.remove(path):
+            logger.info("Deleting broken file: %s", path)
+        removed.append(row)
+
+    return removed
+
+def relocate_videos(plan, channel_id, youtube_ids, synced_paths, kept_folders):
+    # Files of the given videos that the sync did not produce again are left behind by videos
+    # which changed playlist. The manifest's reverse index finds them at once, they are renamed
+    # to the video's new files, or deleted when it has none. Returns their manifest rows.
+    synced = {row[0] for row in synced_paths}
+    made = {}
+    for path, kind, youtube_id, source in synced_paths:
+        if youtube_id and plan.makes(path):
+            made.setdefault((youtube_id, kind), []).append((path, source))
+
+    moved = []
+    for row in state.get_video_paths(channel_id, youtube_ids):
+        path, kind, youtube_id, source = row
+        if path in synced or os.path.dirname(path) in kept_folders:
+            continue
+        moved.append(row)
+        if not os.path.lexists(path):
+            continue
+
+        new_paths = made.get((youtube_id, kind))
+        if new_paths:
+            # A video has a subtitle file per language, match them up by what they link to.
+            new_path, new_source = next((new for new in new_paths if new[1] == source), new_paths[-1])
+            new_paths.remove((new_path, new_source))
+            plan.move(path, new_path)
+            logger.info("Video %s changed playlist, moving: %s -> %s", youtube_id, path, new_path)
+        elif plan.remove(path):
+            logger.info("Video %s changed playlist, deleting: %s", youtube_id, path)
+
+    return moved
+
+def cleanup_channel(plan, channel_id, synced_paths, kept_folders, moved=()):
+    # Check only what the manifest says this channel owns: anything the sync did not
+    # produce again belongs to a video gone from TA, or to a renamed playlist.
+    synced = {row[0] for row in synced_paths}
+    synced.update(row[0] for row in moved)
+    # Videos TA still lists, but whose media file has disappeared, are not synced either.
+    stale = [row for row in state.get_manifest(channel_id)
+        if row[0] not in synced and os.path.dirname(row[0]) not in kept_folders]
+
+    if stale:
+        logger.info("%d stale files found for channel, cleaning up\u2026", len(stale))
+    return remove_stale(plan, stale)
+
+def cleanup_removed_channels(channel_ids, states):
+    # Channels deleted from TA lose their whole folder, whichever of the given state databases has their manifest.
+    plan = Plan()
+    stale = []
+    for db in states:
+        for channel_id in db.get_manifest_channels() - set(channel_ids):
+            logger.info("Channel %s is gone from TA, cleaning up\u2026", channel_id)
+            stale.append((db, channel_id, remove_stale(plan, db.get_manifest(channel_id))))
+
+    if apply_plan(plan):
+        for db, channel_id, rows in stale:
+            db.delete_manifest([row[0] for row in rows])
+            db.delete_episodes(channel_id)
+
+def apply_plan(plan):
+    # Carry out a plan, or only report it on a dry run. Returns whether the tree was changed.
+    with stats_lock:
+        for op, count in plan.counts().items():
+            plan_stats[op] += count
+
+    if DRY_RUN:
+        for line in plan.describe():
+            logger.info("Plan: %s", line)
+        return False
+
+    try:
+        with metrics.phase('apply'):
+            plan.apply()
+    except OSError as error:
+        logger.error(error)
+        # Part of the plan may be on disk, better refresh too much downstream than too little.
+        record_changes(plan.changes())
+        return False
+    for op, path, arg in plan.ops:
+        metrics.count(OP_COUNTERS[op])
+    record_changes(plan.changes())
+    return True
+
+def record_changes(changes):
+    with stats_lock:
+        for change, path in changes:
+            previous = changed_paths.get(path)
+            if previous == 'created' and change == 'modified':
+                continue
+            if previous == 'deleted' and change == 'created':
+                change = 'modified'
+            changed_paths[path] = change
+
+def number_episodes(channel_id, playlist_id, youtube_ids):
+    # Episode numbers of a season's videos, given in the order to number new ones in. A video keeps its number
+    # once it has one, so a new or removed video does not renumber, and rewrite the NFO of, every other video.
+    episodes = state.get_episodes(channel_id, playlist_id)
+    next_num = max(episodes.values(), default=0) + 1
+    new = []
+    for youtube_id in youtube_ids:
+        if youtube_id not in episodes:
+            episodes[youtube_id] = next_num
+            new.append((youtube_id, next_num))
+            next_num += 1
+    if new:
+        state.put_episodes(channel_id, playlist_id, new)
+    return episodes
+
+def process_video(plan, chan_name, playlist_name, video_symlink_name, video, episode_num, season_num, sidecars):
+    # Plan the video's symlink and resources. Returns whether it is a new video.
+    video_path = TA_MEDIA_FOLDER + media_url(video)
+    video_symlink = TARGET_FOLDER + "/" + chan_name + "/" + playlist_name + "/" + video_symlink_name
+
+    new_video = plan.symlink(video_symlink, video_path) == 'create'
+    if new_video:
+        logger.debug("Symlink video \"%s\" to \"%s\".", video_path, video_symlink)
+        logger.info("Processing new video from \"%s\": \"%s\".", chan_name, video.title)
+    else:
+        # This means we already had processed the video, completely normal.
+        logger.debug("Symlink exists for \"%s\".", video_symlink_name)
+
+    # Existing videos still get their NFO refreshed, should TA's metadata have changed.
+    generate_video_nfo(plan, chan_name, playlist_name, video_symlink_name, video, episode_num, season_num)
+
+    if SYMLINK_SUBS:
+        generate_video_subs(plan, chan_name, playlist_name, video_symlink_name, video, sidecars)
+
+    return new_video
+
+def urlify(s):
+    s = re.sub(r"[^\w\s]", "", s)
+    s = re.sub(r"\s+", "_", s)
+    return s
+
+def sanitize(s):
+    s = re.sub(r"[/\\?%*:|\"<>\x7F\x00-\x1F]", "_", s)
+    return s
+
+def simplify_date(s):
+    s = s[:10].replace("-", "")
+    return s
+
+def strmaxlen(s, maxlen):
+    l = maxlen - 1
+    return (s[:l] + '\u2026') if len(s) > maxlen else s
+
+def sync_channel(channel, catalog, force=False, chan_videos_probe=None):
+    # Show container for a channel, with season containers for its own videos and playlists.
+    # chan_videos_probe may hold the first page of the channel's videos, already on its way.
+    # Returns how many filesystem operations it took.
+    logger.debug("===")
+
+    chan_name = str(channel.channel_name)
+    chan_desc = str(channel.channel_description)
+    if (len(chan_name) < 1):
+        chan_name = channel.channel_id
+
+    logger.info("Channel: %s", chan_name)
+    logger.debug("Channel Desc.: %s", strmaxlen(chan_desc, 32))
+
+    chan_name = sanitize(chan_name)
+    chan_path = TARGET_FOLDER + "/" + chan_name
+
+    chan_playlists = catalog.channel_playlists(channel.channel_id)
+    chan_playlist_signatures = {playlist.playlist_id: playlist_signature(playlist) for playlist in chan_playlists}
+
+    # The first page of the channel's videos doubles as a cheap probe for new or removed videos.
+    chan_videos_url = TA_SERVER + '/api/video/'
+    logger.debug("Channel Videos API: %s?channel=%s", chan_videos_url, channel.channel_id)
+    if chan_videos_probe is not None:
+        chan_videos_page = chan_videos_probe.result()
+    else:
+        chan_videos_page = fetch_page(chan_videos_url, {'channel': channel.channel_id})
+    chan_signature = channel_signature(channel, chan_videos_page)
+
+    if QUICK and not force and os.path.exists(chan_path) and channel_markers.get(channel.channel_id) == chan_signature and \
+            all(playlist_markers.get(playlist_id) == signature for playlist_id, signature in chan_playlist_signatures.items()):
+        logger.debug("Channel unchanged since last run, skipping.")
+        return 0
+
+    # Everything this sync produces for the channel, for the manifest.
+    synced_paths = [(chan_path, 'channel', None, None)]
+    kept_folders = set()
+    video_ids = set()
+    left_ids = set()
+    markers = []
+    new_videos = []
+    # Sidecar files of the channel's media folders, scanned when first needed.
+    sidecars = {}
+
+    plan = Plan()
+    if plan.folder(chan_path):
+        logger.info("New channel \"%s\", setup resources.", chan_name)
+    setup_channel_resources(plan, chan_name, channel)
+
+    logger.debug("---")
+
+    # Season container for videos not assigned to playlists.
+    season_num = 1
+
+    playlist_name = "Videos"
+    playlist_desc = "Channel's videos not assigned to playlists."
+    logger.debug("Playlist: %s", playlist_name)
+    logger.debug("Playlist Description: %s", playlist_desc)
+
+    videos_path = TARGET_FOLDER + "/" + chan_name + "/" + playlist_name
+    synced_paths.append((videos_path, 'folder', None, None))
+    if plan.folder(videos_path):
+        logger.info("New playlist \"%s\", setup resources.", playlist_name)
+    playlist_data = Playlist({
+        'playlist_id': "",
+        'playlist_name': playlist_name,
+        'playlist_description': playlist_desc,
+        'playlist_last_refresh': "",
+        'playlist_channel_id': channel.channel_id
+    })
+    setup_channel_playlist_resources(plan, chan_name, playlist_name, playlist_data, season_num)
+
+    season_videos = []
+    listed = 0
+    for chan_videos_page_data in iter_pages(chan_videos_url, {'channel': channel.channel_id}, chan_videos_page):
+        # Remember listed videos, so playlist entries can reuse them.
+        chan_videos_data = [catalog.add_video(video_data) for video_data in chan_videos_page_data]
+        state.put_videos(chan_videos_data)
+
+        listed += len(chan_videos_data)
+        for video_data in chan_videos_data:
+            # Videos TA still lists but whose media file is gone get no files, clean-up removes the old ones.
+            if not has_media(sidecars, video_data):
+                logger.debug("Media file of %s is missing, skipping.", video_data.youtube_id)
+                continue
+            video_ids.add(video_data.youtube_id)
+
+            # Videos assigned to playlists go in their playlist's folder, their files here are moved there.
+            if len(video_data.playlist) > 0:
+                continue
+            season_videos.append(video_data)
+
+    # TA lists the newest videos first.
+    episode_nums = number_episodes(channel.channel_id, "", [video_data.youtube_id for video_data in reversed(season_videos)])
+    for video_data in season_videos:
+        video_chan = video_data.channel_name or video_data.channel_id
+        custom_name = urlify(sanitize(video_chan)) + " - " + simplify_date(video_data.published) + " - [" + video_data.youtube_id + "]"
+        video_symlink_name = custom_name + ".mp4"
+
+        record_video_paths(synced_paths, chan_name, playlist_name, video_symlink_name, video_data, sidecars)
+        if process_video(plan, chan_name, playlist_name, video_symlink_name, video_data, episode_nums[video_data.youtube_id], season_num, sidecars):
+            new_videos.append(video_data)
+
+    logger.debug("Valid videos not assigned to playlists: %s / %s", len(season_videos), listed)
+
+    markers.append((channel_markers, 'channel', channel.channel_id, chan_signature))
+
+    # Season containers for all playlists by this channel.
+    for playlist in chan_playlists:
+        logger.debug('---')
+
+        season_num += 1
+        playlist_name = sanitize(playlist.playlist_name)
+        playlist_desc = str(playlist.playlist_description)
+        logger.debug("Playlist: %s", str(playlist_name))
+        logger.debug("Playlist Desc.: %s", strmaxlen(playlist_desc, 32))
+
+        if (len(playlist_name) < 1):
+            playlist_name = playlist.playlist_id
+
+        playlist_folder = TARGET_FOLDER + "/" + chan_name + "/" + playlist_name
+        synced_paths.append((playlist_folder, 'folder', None, None))
+        playlist_signature_now = chan_playlist_signatures[playlist.playlist_id]
+        if QUICK and not force and os.path.exists(playlist_folder) and playlist_markers.get(playlist.playlist_id) == playlist_signature_now:
+            logger.debug("Playlist unchanged since last run, skipping.")
+            kept_folders.add(playlist_folder)
+            continue
+
+        if plan.folder(playlist_folder):
+            logger.info("New playlist \"%s\", setup resources.", playlist_name)
+        setup_channel_playlist_resources(plan, chan_name, playlist_name, playlist, season_num)
+
+        season_videos = []
+        playlist_youtube_ids = [youtube_id for youtube_id, downloaded in playlist.entries]
+        playlist_videos = fetch_videos(playlist_youtube_ids, catalog)
+        for youtube_id, video_data in zip(playlist_youtube_ids, playlist_videos):
+            if video_data is None:
+                logger.debug("Missing video data for %s.", youtube_id)
+                continue
+            if not has_media(sidecars, video_data):
+                logger.debug("Media file of %s is missing, skipping.", youtube_id)
+                continue
+            video_ids.add(youtube_id)
+            season_videos.append(video_data)
+
+        episode_nums = number_episodes(channel.channel_id, playlist.playlist_id, [video_data.youtube_id for video_data in season_videos])
+        for video_data in season_videos:
+            video_chan = video_data.channel_name or video_data.channel_id
+            custom_name = urlify(sanitize(video_chan)) + " - " + simplify_date(video_data.published) + " - [" + video_data.youtube_id + "]"
+            video_symlink_name = custom_name + ".mp4"
+
+            record_video_paths(synced_paths, chan_name, playlist_name, video_symlink_name, video_data, sidecars)
+            if process_video(plan, chan_name, playlist_name, video_symlink_name, video_data, episode_nums[video_data.youtube_id], season_num, sidecars):
+                new_videos.append(video_data)
+
+        logger.debug("Valid videos assigned to this playlist: %s / %s", len(season_videos), len(playlist.entries))
+
+        markers.append((playlist_markers, 'playlist', playlist.playlist_id, playlist_signature_now))
+        # Videos that left the playlist may not be synced anywhere else in this channel, their old files are found by id.
+        left_ids.update(set(filter(None, playlist_entries.get(playlist.playlist_id, "").split(","))) - set(playlist_youtube_ids))
+        markers.append((playlist_entries, 'playlist_entries', playlist.playlist_id, playlist_entry_ids(playlist)))
+
+    moved = relocate_videos(plan, channel.channel_id, video_ids | left_ids, synced_paths, kept_folders)
+    moved_videos = {youtube_id for path, kind, youtube_id, source in moved if kind == 'video'}
+    new_videos = [video_data for video_data in new_videos if video_data.youtube_id not in moved_videos]
+
+    stale = []
+    if CLEANUP_DELETED_VIDEOS:
+        with metrics.phase('cleanup'):
+            stale = cleanup_channel(plan, channel.channel_id, synced_paths, kept_folders, moved)
+
+    if not apply_plan(plan):
+        return len(plan.ops)
+
+    if notifier is not None:
+        notifier.add(new_videos)
+        metrics.count('notifications_queued', len(new_videos))
+
+    # Only remember the channel as synced once its changes are on disk.
+    state.delete_manifest([row[0] for row in stale + moved])
+    state.put_manifest(channel.channel_id, synced_paths)
+    for memory, kind, id, signature in markers:
+        state.put_marker(kind, id, signature)
+        memory[id] = signature
+    if dirty_channels.pop(channel.channel_id, None) is not None:
+        state.delete_marker('dirty', channel.channel_id)
+    return len(plan.ops)
+
+def mark_playlist_owners(catalog):
+    # A video added to or removed from a playlist of another channel moves between folders of both channels,
+    # but only the playlist's channel has a marker that moves. Mark the channels owning such videos as dirty,
+    # so QUICK does not skip them. They stay dirty until they are synced, even across runs.
+    joined = {}
+    left = {}
+    for playlist in catalog.playlists.values():
+        previous = playlist_entries.get(playlist.playlist_id)
+        if previous == playlist_entry_ids(playlist):
+            continue
+        new = {youtube_id for youtube_id, downloaded in playlist.entries}
+        old = set(filter(None, (previous or "").split(",")))
+        for youtube_id in new - old:
+            joined.setdefault(youtube_id, set()).add(playlist.playlist_channel_id)
+        for youtube_id in old - new:
+            left.setdefault(youtube_id, set()).add(playlist.playlist_channel_id)
+    for playlist_id, previous in playlist_entries.items():
+        if playlist_id not in catalog.playlists:
+            # A deleted playlist gives all its videos back to their channels.
+            for youtube_id in filter(None, previous.split(",")):
+                left.setdefault(youtube_id, set()).add("")
+
+    owners = {}
+    # Videos joining a playlist leave the folders they have files in, the manifest knows whose those are.
+    # Videos nobody has files for yet, as on a first run, have nothing to move.
+    for youtube_id, channel_ids in state.get_video_channels(joined).items():
+        for channel_id in channel_ids - joined[youtube_id]:
+            owners.setdefault(channel_id, youtube_id)
+    # Videos leaving a playlist go back to their own channel. That is in the metadata cache
+    # for nearly all of them, as they were listed by the playlist's last sync.
+    cached = state.get_videos(left) if left else {}
+    for youtube_id, channel_ids in left.items():
+        video = cached.get(youtube_id) or fetch_video(youtube_id)
+        if video is not None and video.channel_id not in channel_ids:
+            owners.setdefault(video.channel_id, youtube_id)
+
+    for channel_id, youtube_id in owners.items():
+        if channel_id not in dirty_channels:
+            logger.debug("Video %s changed playlist of another channel, syncing channel %s.", youtube_id, channel_id)
+            dirty_channels[channel_id] = ""
+            if not DRY_RUN:
+                state.put_marker('dirty', channel_id, "")
+
+    # Only forgotten once the channels to sync are, should the run be cut short. The entries of the
+    # playlists still there are remembered by the sync of their channel, which needs the old ones
+    # to find the files of the videos that left.
+    for playlist_id in list(playlist_entries):
+        if playlist_id not in catalog.playlists:
+            del playlist_entries[playlist_id]
+            if not DRY_RUN:
+                state.delete_marker('playlist_entries', playlist_id)
+
+def sync_channel_worker(channel, catalog, force=False, chan_videos_probe=None):
+    # Sync a channel in one of the workers, keeping track of the worker's throughput.
+    start = time.monotonic()
+    ops = 0
+    try:
+        with metrics.phase('sync_channels'):
+            ops = sync_channel(channel, catalog, force, chan_videos_probe)
+    except ApiError as error:
+        # Its markers and manifest are left as they were, so the next run tries the channel again.
+        logger.error("Skipping channel %s, TA API failed: %s", channel.channel_id, error)
+    finally:
+        catalog.drop_videos(channel.channel_id)
+    with stats_lock:
+        stats = worker_stats.setdefault(threading.current_thread().name, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += ops
+        stats[2] += time.monotonic() - start
+
+def run_sync(youtube_ids=(), channel_ids=(), full_cleanup=False, shard=None):
+    # One sync of TA into TARGET_FOLDER, limited to the given videos and channels if any,
+    # or to one shard of the channels, followed by its run report.
+    run_reported(sync_library, youtube_ids, channel_ids, full_cleanup, shard)
+
+def run_reported(job, *args):
+    metrics.reset()
+    api.reset_stats()
+    success = False
+    try:
+        job(*args)
+        success = True
+    finally:
+        metrics.finish(success)
+        logger.info("Phases: %s.", metrics.summary())
+        logger.info("TA API: %s.", api.stats())
+        write_run_report()
+
+def write_run_report():
+    if not REPORT_FILE and not PROMETHEUS_TEXTFILE:
+        return
+    try:
+        write_report(metrics.report(), REPORT_FILE, PROMETHEUS_TEXTFILE)
+    except OSError as error:
+        logger.error("Unable to write run report: %s", error)
+
+def reset_run_stats():
+    fetch_stats.update(entries=0, cached=0, fetched=0)
+    plan_stats.update(dict.fromkeys(plan_stats, 0))
+    changed_paths.clear()
+    worker_stats.clear()
+
+def in_shard(channel_id, shard):
+    # Channels are spread over shards by a hash that is the same in every process and on every host.
+    index, count = shard
+    return zlib.crc32(channel_id.encode()) % count == index
+
+def sync_library(youtube_ids=(), channel_ids=(), full_cleanup=False, shard=None):
+    global channel_markers, playlist_markers, playlist_entries, dirty_channels
+
+    targeted = bool(youtube_ids or channel_ids)
+    if targeted:
+        logger.info("Fetching all playlists\u2026")
+    elif shard is not None:
+        logger.info("Fetching all playlists and the channels of shard %d/%d\u2026", shard[0] + 1, shard[1])
+    else:
+        logger.info("Fetching all playlists and channels\u2026")
+
+    reset_run_stats()
+
+    # Get all playlists from TA API. TA does not list them by channel, so all of them
+    # are needed before the first channel can be synced.
+    playlist_url = TA_SERVER + '/api/playlist/'
+    logger.debug("Playlist API: %s", playlist_url)
+    playlists_page = fetch_page(playlist_url)
+    if playlists_page is None:
+        logger.info("No playlists in TA, exiting\u2026")
+        # Bail from sync as we have no playlists in TA.
+        return
+
+    catalog = Catalog()
+    for playlists_data in iter_pages(playlist_url, page_json=playlists_page):
+        for playlist in playlists_data:
+            catalog.add_playlist(playlist)
+
+    if targeted:
+        channels_data = fetch_target_channels(youtube_ids, channel_ids, catalog)
+        if channels_data:
+            logger.info("Targeted sync of %d channels.", len(channels_data))
+        else:
+            # None of the ids resolved, so the trigger was not really about them. Sync everything instead.
+            logger.info("No target found in TA, falling back to a full sync.")
+            targeted = False
+    if not targeted:
+        # Stream all channels from TA API, they are synced while the next pages download.
+        chan_url = TA_SERVER + '/api/channel/'
+        logger.debug("Channel API: %s", chan_url)
+        channels_page = fetch_page(chan_url)
+        if channels_page is None:
+            logger.info("No channels in TA, exiting\u2026")
+            # Bail from sync as we have no channels in TA.
+            return
+        channels_data = (catalog.add_channel(channel) for page in iter_pages(chan_url, page_json=channels_page) for channel in page
+            if shard is None or in_shard(channel['channel_id'], shard))
+
+    logger.info("Processing channels\u2026")
+
+    # Markers stay in memory between syncs of a daemon.
+    if channel_markers is None:
+        channel_markers = state.get_markers('channel')
+        playlist_markers = state.get_markers('playlist')
+        playlist_entries = state.get_markers('playlist_entries')
+        dirty_channels = state.get_markers('dirty')
+    mark_playlist_owners(catalog)
+
+    # Show containers for all channels. Channels don't share any files, so they are synced in parallel,
+    # while each channel's videos are still walked in order to keep episode and season numbers stable.
+    # The first page of a queued channel's videos downloads while the workers are busy, and no more than
+    # SYNC_WORKERS channels wait in the queue, so memory does not grow with the library.
+    synced_channel_ids = []
+    chan_videos_url = TA_SERVER + '/api/video/'
+    with ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="sync") as executor, \
+            ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="prefetch") as prefetch:
+        futures = deque()
+        for channel in channels_data:
+            synced_channel_ids.append(channel.channel_id)
+            probe = prefetch.submit(fetch_page, chan_videos_url, {'channel': channel.channel_id})
+            force = targeted or channel.channel_id in dirty_channels
+            futures.append(executor.submit(sync_channel_worker, channel, catalog, force, probe))
+            while len(futures) > SYNC_WORKERS * 2:
+                futures.popleft().result()
+        for future in futures:
+            future.result()
+
+    for name, (channels, ops, seconds) in sorted(worker_stats.items()):
+        logger.info("Worker %s: %d channels, %d filesystem operations in %.2fs (%.1f/s).",
+            name, channels, ops, seconds, ops / seconds if seconds else 0)
+
+    logger.info("Video metadata: %d playlist entries, %d from cache, %d fetched, saved %d HTTP calls.",
+        fetch_stats['entries'], fetch_stats['cached'], fetch_stats['fetched'], fetch_stats['entries'] - fetch_stats['fetched'])
+
+    if notifier is not None:
+        notifier.flush()
+
+    evicted = state.evict_videos()
+    if evicted:
+        logger.debug("Evicted %d videos from metadata cache.", evicted)
+
+    # Deleted videos of synced channels are already cleaned up from the manifest by now. Targeted syncs
+    # and shards only see part of the library, so leave deleted channels and the full walk to full runs,
+    # and to the clean-up after all shards.
+    if not targeted and shard is None:
+        cleanup_library(synced_channel_ids, full_cleanup)
+
+    finish_run(shard)
+
+def cleanup_library(channel_ids, full_cleanup=False):
+    # If enabled, check for deleted video and if found cleanup video NFO file and video and subtitle symlinks.
+    if not CLEANUP_DELETED_VIDEOS:
+        return
+    if not channel_ids:
+        # An empty listing would have every channel deleted.
+        logger.info("No channels in TA, skipping clean-up.")
+        return
+    # Shards on other hosts keep their manifests in databases of their own.
+    states = [state] + [State(path, readonly=DRY_RUN) for path in shard_state_dbs() if path != STATE_DB]
+    try:
+        with metrics.phase('cleanup'):
+            cleanup_removed_channels(channel_ids, states)
+        if full_cleanup and not DRY_RUN:
+            with metrics.phase('cleanup_walk'):
+                cleanup_after_deleted_videos()
+                if artwork_store is not None:
+                    deleted = artwork_store.prune(states)
+                    if deleted:
+                        logger.info("Deleted %d unused files from the artwork store.", deleted)
+    finally:
+        for db in states[1:]:
+            db.close()
+
+def shard_state_db(shard):
+    # State database of a shard run on its own, e.g. .ta-helper-shard-1-of-4.db. SQLite cannot safely share
+    # one database between hosts over NFS, so shards on several hosts each write their own.
+    root, ext = os.path.splitext(STATE_DB)
+    return "%s-shard-%d-of-%d%s" % (root, shard[0] + 1, shard[1], ext)
+
+def shard_state_dbs():
+    root, ext = os.path.splitext(STATE_DB)
+    return sorted(glob.glob(glob.escape(root) + "-shard-*-of-*" + glob.escape(ext)))
+
+def finish_run(shard=None):
+    logger.info("%s: %s.", "Dry run, would apply" if DRY_RUN else "Filesystem",
+        ", ".join("%d %s" % (count, op) for op, count in plan_stats.items()))
+    if DRY_RUN:
+        return
+
+    if CHANGES_FILE:
+        # A shard of a local pool, the pool runs ReplayGain and POSTPROCESS_COMMAND once for all of them.
+        with open(CHANGES_FILE, "w") as changes_file:
+            write_changes(changes_file)
+        return
+
+    if REPLAYGAIN_CHANNELS:
+        with metrics.phase('replaygain'):
+            run_replaygain(shard)
+    if POSTPROCESS_COMMAND:
+        postprocess()
+
+def run_replaygain(shard=None):
+    # Analyse the videos of the channels in REPLAYGAIN_CHANNELS, given by id or by folder name,
+    # skipping files that did not change since their last analysis.
+    pruned = state.prune_replaygain()
+    if pruned:
+        logger.debug("Forgot ReplayGain of %d files.", pruned)
+
+    paths = []
+    for channel_id in state.get_manifest_channels():
+        if shard is not None and not in_shard(channel_id, shard):
+            continue
+        rows = state.get_manifest(channel_id)
+        names = {os.path.basename(path) for path, kind, youtube_id, source in rows if kind == 'channel'}
+        if channel_id in REPLAYGAIN_CHANNELS or names.intersection(REPLAYGAIN_CHANNELS):
+            paths.extend(path for path, kind, youtube_id, source in rows if kind == 'video')
+
+    analysed, failed, current = replaygain.run(state, paths, REPLAYGAIN_COMMAND, REPLAYGAIN_WORKERS, logger, metrics)
+    logger.info("ReplayGain: %d files analysed, %d failed, %d up to date.", analysed, failed, current)
+
+def write_changes(changes_file):
+    # One "created", "modified" or "deleted" and its path per line, separated by a tab.
+    changes_file.writelines("%s\t%s\n" % (change, path) for path, change in sorted(changed_paths.items()))
+
+def read_changes(path):
+    with open(path) as changes_file:
+        record_changes(line.rstrip("\n").split("\t", 1) for line in changes_file)
+
+def cleanup_only(full_cleanup=False):
+    # The clean-up pass of a sharded sync, once all shards are done.
+    reset_run_stats()
+    if not CLEANUP_DELETED_VIDEOS:
+        logger.info("CLEANUP_DELETED_VIDEOS is set to False in .env settings, nothing to clean up.")
+        return
+    cleanup_library(all_channel_ids(), full_cleanup)
+    finish_run()
+
+def all_channel_ids():
+    logger.info("Fetching all channels\u2026")
+    return [channel['channel_id'] for page in iter_pages(TA_SERVER + '/api/channel/') for channel in page]
+
+def sync_shards(count, full_cleanup=False):
+    # Sync all channels in count processes at once, then clean up and post process once for all of them.
+    logger.info("Syncing in %d shards\u2026", count)
+    reset_run_stats()
+    with tempfile.TemporaryDirectory(prefix="ta-helper-shards-") as shards_folder:
+        shards = []
+        for i in range(count):
+            report_path = os.path.join(shards_folder, "report-%d.json" % i)
+            changes_path = os.path.join(shards_folder, "changes-%d.tsv" % i)
+            # Shards of a local pool run on this host, they share its state database.
+            args = [sys.executable, "-m", "ta_helper", "--shard", "%d/%d" % (i + 1, count), "--changes-file", changes_path]
+            if DRY_RUN:
+                args.append("--dry-run")
+            env = dict(os.environ, REPORT_FILE=report_path, PROMETHEUS_TEXTFILE="")
+            # Find this copy of ta_helper, whether it is installed or run from a checkout.
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [PACKAGE_ROOT, os.environ.get('PYTHONPATH')]))
+            shards.append((i, report_path, changes_path, subprocess.Popen(args, env=env)))
+
+        failed = []
+        for i, report_path, changes_path, process in shards:
+            if process.wait() != 0:
+                failed.append(i + 1)
+            # Add up what the shards did in this run's report.
+            if os.path.exists(report_path):
+                with open(report_path) as report_file:
+                    report = json.load(report_file)
+                for name, phase in report['phases'].items():
+                    metrics.add_phase_time(name, phase['seconds'])
+                for name, value in report['counters'].items():
+                    metrics.count(name, value)
+                for op, counter in OP_COUNTERS.items():
+                    plan_stats[op] += report['counters'].get(counter, 0)
+            if os.path.exists(changes_path):
+                read_changes(changes_path)
+
+    if failed:
+        # Channels of failed shards were not synced, so leave clean-up to the next run.
+        logger.error("Shards %s failed, skipping clean-up.", ", ".join(map(str, failed)))
+        finish_run()
+        raise RuntimeError("%d of %d shards failed" % (len(failed), count))
+
+    if not DRY_RUN:
+        # The shards have let go of the tree by now, anything started since waits for the clean-up.
+        lock(LOCK_FILE)
+    if CLEANUP_DELETED_VIDEOS:
+        cleanup_library(all_channel_ids(), full_cleanup)
+    finish_run()
+
+def postprocess():
+    # Downstream jobs only need to look at what changed, and not run at all when nothing did.
+    if not changed_paths:
+        logger.info("Nothing changed, skipping \"%s\".", POSTPROCESS_COMMAND)
+        return
+
+    logger.info("Running: \"%s\" for %d changed paths", POSTPROCESS_COMMAND, len(changed_paths))
+    with metrics.phase('postprocess'), \
+            tempfile.NamedTemporaryFile("w", prefix="ta-helper-changes-", suffix=".tsv") as changes_file:
+        write_changes(changes_file)
+        changes_file.flush()
+        subprocess.run(POSTPROCESS_COMMAND, env=dict(os.environ, TA_HELPER_CHANGES_FILE=changes_file.name))
+
+def library_probe():
+    # Cheap fingerprint of the whole library, from the first page of each listing.
+    probe = []
+    for url in ['/api/video/', '/api/channel/', '/api/playlist/']:
+        page_json = fetch_page(TA_SERVER + url)
+        if page_json is None:
+            return None
+        probe.append([page_json['paginate'].get('total_hits'),
+            [item.get('youtube_id') or item.get('channel_last_refresh') or item.get('playlist_last_refresh') for item in page_json['data']]])
+    return probe
+
+class Daemon(RunQueue):
+    # Keeps ta-helper warm between syncs. Polls TA every interval, and runs
+    # syncs handed over in-process through add() as soon as they settle.
+
+    def __init__(self, interval, debounce):
+        super().__init__()
+        self.interval = interval
+        self.debounce = debounce
+        self.last_probe = None
+        self.polls = 0
+
+    def wait_for_work(self):
+        # Returns the merged triggers, or None once it is time to poll.
+        with self.cond:
+            deadline = time.monotonic() + self.interval
+            while self.pending is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            while self.pending is not None:
+                remaining = self.last_trigger + self.debounce - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            return self.take()
+
+    def poll(self):
+        self.polls += 1
+        probe = library_probe()
+        # Still do a complete pass every so often, the probe cannot see every kind of change.
+        if probe is not None and probe == self.last_probe and self.polls % DAEMON_FULL_EVERY:
+            logger.debug("No changes in TA since last poll.")
+            return
+        self.last_probe = probe
+        self.sync()
+
+    def sync(self, *args):
+        # Only hold the tree while syncing, so one-off runs can get in between syncs.
+        lock_file = None if DRY_RUN else lock(LOCK_FILE)
+        try:
+            run_sync(*args)
+        finally:
+            if lock_file is not None:
+                unlock(lock_file)
+
+    def run(self):
+        work = None
+        while True:
+            start = time.monotonic()
+            try:
+                if work is None:
+                    self.poll()
+                elif work['full']:
+                    self.sync()
+                else:
+                    self.sync(list(work['videos']), list(work['channels']))
+                exit_code = 0
+            except Exception:
+                logger.exception("Sync failed.")
+                exit_code = 1
+
+            self.finish(start, exit_code)
+            work = self.wait_for_work()
+
+def open_state():
+    global state, notifier, artwork_store
+    if not DRY_RUN:
+        os.makedirs(TARGET_FOLDER, exist_ok = True)
+    if state is None:
+        # A dry run neither creates TARGET_FOLDER nor writes to the database.
+        state = State(STATE_DB, max_age=VIDEO_CACHE_DAYS * 86400, max_videos=VIDEO_CACHE_SIZE, readonly=DRY_RUN)
+    if artwork_store is None and ARTWORK_MODE == 'materialize':
+        artwork_store = ArtworkStore(TARGET_FOLDER + "/.artwork", state, ARTWORK_MAX_SIZE, logger, metrics)
+    if notifier is None and NOTIFICATIONS_ENABLED:
+        notifier = Notifier(APPRISE_LINK, TA_SERVER, NOTIFY_DIGEST, logger, metrics)
+
+def start_daemon():
+    # Run the daemon in a background thread, for callers hosting ta-helper in their own process.
+    check_config()
+    open_state()
+    daemon = Daemon(DAEMON_INTERVAL, DAEMON_DEBOUNCE)
+    threading.Thread(target=daemon.run, daemon=True).start()
+    return daemon
+
+def parse_shard(value):
+    # "i/N" on the command line, 0-based (index, count) internally.
+    match = re.fullmatch(r"(\d+)/(\d+)", value)
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise argparse.ArgumentTypeError("expected i/N with 1 <= i <= N, e.g. 1/4")
+    return int(match.group(1)) - 1, int(match.group(2))
+
+def lock(path, shared=False, wait=True):
+    # Hold a lock on path until the process exits. POSIX locks also work between hosts sharing TARGET_FOLDER
+    # over NFS. Shards share the lock of the whole tree, full runs and clean-ups take it for themselves.
+    lock_file = open(path, "a+")
+    mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    try:
+        fcntl.lockf(lock_file, mode | fcntl.LOCK_NB)
+    except OSError:
+        if not wait:
+            lock_file.close()
+            return None
+        logger.info("Waiting for another ta-helper to release %s\u2026", path)
+        fcntl.lockf(lock_file, mode)
+    held_locks.append(lock_file)
+    return lock_file
+
+def unlock(lock_file):
+    fcntl.lockf(lock_file, fcntl.LOCK_UN)
+    held_locks.remove(lock_file)
+    lock_file.close()
+
+def main():
+    global DRY_RUN, CHANGES_FILE, STATE_DB
+    parser = argparse.ArgumentParser(description="Post process Tube Archivist products into human readable folders.")
+    parser.add_argument('--invalidate-cache', nargs='*', metavar='YOUTUBE_ID',
+        help="drop cached video metadata (all of it if no ids are given) and exit")
+    parser.add_argument('--video', action='append', metavar='YOUTUBE_ID',
+        help="only sync the channels and playlists holding this video, may be repeated")
+    parser.add_argument('--channel', action='append', metavar='CHANNEL_ID',
+        help="only sync this channel and its playlists, may be repeated")
+    parser.add_argument('--full-cleanup', action='store_true',
+        help="also walk all of TARGET_FOLDER for broken symlinks and hanging files, if CLEANUP_DELETED_VIDEOS is enabled")
+    parser.add_argument('--dry-run', action='store_true',
+        help="only print the filesystem changes a sync would make")
+    parser.add_argument('--daemon', action='store_true',
+        help="keep running, and sync whenever polling TA shows changes")
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+        help="only sync the I-th of N parts of the channels and skip the clean-up, e.g. on several hosts sharing TARGET_FOLDER")
+    parser.add_argument('--shards', type=int, metavar='N',
+        help="sync in N processes at once, each taking one shard, then clean up once")
+    parser.add_argument('--cleanup-only', action='store_true',
+        help="only clean up after channels deleted from TA, once all shards are done")
+    parser.add_argument('--changes-file', metavar='PATH',
+        help="write the changed paths to PATH instead of running POSTPROCESS_COMMAND")
+    args = parser.parse_args()
+    DRY_RUN = args.dry_run
+    CHANGES_FILE = args.changes_file or ""
+    check_config()
+
+    modes = [args.daemon, args.shard is not None, bool(args.shards), args.cleanup_only, bool(args.video or args.channel)]
+    if sum(modes) > 1:
+        parser.error("--daemon, --shard, --shards, --cleanup-only and --video/--channel do not go together")
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards needs at least one shard")
+
+    if args.shard is not None and not args.changes_file:
+        # A shard on its own, likely one of several hosts, see shard_state_db().
+        STATE_DB = shard_state_db(args.shard)
+    open_state()
+
+    if args.invalidate_cache is None and not args.shards and not args.daemon and not DRY_RUN:
+        # Keep runs from changing the tree at the same time, but let shards run side by side.
+        lock(LOCK_FILE, shared=args.shard is not None)
+        if args.shard is not None and not lock(TARGET_FOLDER + "/.ta-helper-shard-%d-of-%d.lock" % (args.shard[0] + 1, args.shard[1]), wait=False):
+            logger.error("Shard %d/%d is already running.", args.shard[0] + 1, args.shard[1])
+            sys.exit(1)
+
+    if args.invalidate_cache is not None:
+        deleted = state.invalidate_videos(args.invalidate_cache)
+        logger.info("Invalidated %d cached videos.", deleted)
+    elif args.daemon:
+        logger.info("Running as daemon, polling TA every %d seconds.", DAEMON_INTERVAL)
+        Daemon(DAEMON_INTERVAL, DAEMON_DEBOUNCE).run()
+    elif args.shards:
+        run_reported(sync_shards, args.shards, args.full_cleanup)
+    elif args.cleanup_only:
+        run_reported(cleanup_only, args.full_cleanup)
+    else:
+        run_sync(args.video or [], args.channel or [], args.full_cleanup, args.shard)
+
+    if notifier is not None:
+        # Notifications are sent in the background, let them go out before exiting,
+        # and count them in the run report.
+        notifier.wait()
+        write_run_report()
+    state.close()
@@ -0,0 +1,8 @@
+def strtobool(value):
+    # Same as distutils.util.strtobool, which is gone since Python 3.12.
+    value = value.strip().lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return 1
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return 0
+    raise ValueError("invalid truth value %r" % value)